@@ -0,0 +1,59 @@
+import json
+import os
+import sqlite3
+import zlib
+from ConferenceScraperApp.word_store import word_features_to_json, word_features_from_json
+
+AGGREGATE_STORE_FILENAME = "aggregates.sqlite3"
+# bumped whenever the stored layout of word_features changes so older entries are not reused
+AGGREGATE_FORMAT = 5
+
+
+def get_aggregate_store_path(cache_directory):
+    return os.path.join(cache_directory, AGGREGATE_STORE_FILENAME)
+
+
+class AggregateStore:
+    """
+    Keeps the word_list and word_features produced by each session so later
+    runs can merge them instead of processing the session again. Each entry is
+    keyed by (lang, year, month) and a settings_key that describes the options
+    that change the aggregate, so a run with different options doesn't reuse
+    counts it wouldn't have produced itself.
+    """
+
+    def __init__(self, path, check_same_thread=True):
+        # a store shared by threads is passed check_same_thread=False and guarded by a lock of its own
+        self.connection = sqlite3.connect(path, timeout=60, check_same_thread=check_same_thread)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS aggregates ("
+                                "lang TEXT, year TEXT, month TEXT, settings_key TEXT, aggregate BLOB, "
+                                "PRIMARY KEY (lang, year, month, settings_key))")
+        self.connection.commit()
+
+    def get_settings_key(self, pipeline_key, show_transliteration):
+        # transliteration is saved in word_features so it changes the aggregate as well
+        return "v%s-%s-%s" % (AGGREGATE_FORMAT, pipeline_key, "translit" if show_transliteration else "no-translit")
+
+    def has_session(self, lang, year, month, settings_key):
+        row = self.connection.execute("SELECT 1 FROM aggregates "
+                                      "WHERE lang = ? AND year = ? AND month = ? AND settings_key = ?",
+                                      (lang, year, month, settings_key)).fetchone()
+        return row is not None
+
+    def load_session(self, lang, year, month, settings_key):
+        row = self.connection.execute("SELECT aggregate FROM aggregates "
+                                      "WHERE lang = ? AND year = ? AND month = ? AND settings_key = ?",
+                                      (lang, year, month, settings_key)).fetchone()
+        word_features = word_features_from_json(json.loads(zlib.decompress(row[0]).decode("utf-8")))
+        return word_features.counts, word_features
+
+    def save_session(self, lang, year, month, settings_key, word_list, word_features):
+        aggregate = json.dumps(word_features_to_json(word_list, word_features), ensure_ascii=False,
+                               separators=(",", ":"))
+        with self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO aggregates (lang, year, month, settings_key, aggregate) "
+                                    "VALUES (?, ?, ?, ?, ?)",
+                                    (lang, year, month, settings_key, zlib.compress(aggregate.encode("utf-8"))))
+
+    def close(self):
+        self.connection.close()
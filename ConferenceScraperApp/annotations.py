@@ -0,0 +1,56 @@
+import hashlib
+import json
+import os
+import sqlite3
+
+ANNOTATION_CACHE_FILENAME = "annotations.sqlite3"
+# sqlite limits the number of parameters in a single statement
+LOOKUP_CHUNK_SIZE = 500
+
+
+def get_annotation_cache_path(cache_directory):
+    return os.path.join(cache_directory, ANNOTATION_CACHE_FILENAME)
+
+
+class AnnotationCache:
+    """
+    Stores the tokens, lemma, part of speech and sentence text produced for each
+    paragraph. Entries are keyed by a hash of the paragraph text and the
+    pipeline_key, which names the library versions, language and processors,
+    so a change to any of those simply misses the cache instead of returning
+    stale annotations.
+    """
+
+    def __init__(self, path, pipeline_key):
+        self.pipeline_key = pipeline_key
+        # the connection is opened by the main thread and used by the annotate stage of the pipeline
+        self.connection = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS annotations (key TEXT PRIMARY KEY, annotation TEXT)")
+        self.connection.commit()
+
+    def get_key(self, paragraph):
+        return hashlib.sha256(("%s\n%s" % (self.pipeline_key, paragraph)).encode("utf-8")).hexdigest()
+
+    def get_many(self, paragraphs):
+        """
+        Return the cached annotation for each paragraph, or None for the
+        paragraphs that haven't been annotated with this pipeline yet.
+        """
+        keys = [self.get_key(paragraph) for paragraph in paragraphs]
+        found = {}
+        for start in range(0, len(keys), LOOKUP_CHUNK_SIZE):
+            chunk = keys[start:start + LOOKUP_CHUNK_SIZE]
+            rows = self.connection.execute("SELECT key, annotation FROM annotations WHERE key IN (%s)" %
+                                           ",".join("?" * len(chunk)), chunk)
+            for key, annotation in rows:
+                found[key] = json.loads(annotation)
+        return [found.get(key) for key in keys]
+
+    def put_many(self, paragraphs, annotations):
+        rows = [(self.get_key(paragraph), json.dumps(annotation, ensure_ascii=False, separators=(",", ":")))
+                for paragraph, annotation in zip(paragraphs, annotations)]
+        self.connection.executemany("INSERT OR REPLACE INTO annotations (key, annotation) VALUES (?, ?)", rows)
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
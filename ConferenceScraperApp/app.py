@@ -3,151 +3,207 @@ import os
 import getopt
 from datetime import date
 import re
-import random
-# Progress bar
-from tqdm import tqdm
-# Web requests
-import requests
-# Web scraping
-from bs4 import BeautifulSoup
-# Transliteration
-from transliterate import translit, get_available_language_codes
+import heapq
+# The heavy dependencies (stanza, nltk, simplemma, transliterate, bs4, requests, tqdm and googletrans) are
+# imported in the functions that use them so that only the options that need them pay for loading them.
+# Cache of the linguistic annotations
+from ConferenceScraperApp.annotations import AnnotationCache, get_annotation_cache_path
+# Compressed sqlite session cache
+from ConferenceScraperApp.session_store import SessionStore, get_session_store_path
+# Per-session word counts for incremental runs
+from ConferenceScraperApp.aggregates import AggregateStore, get_aggregate_store_path
+# Word features with shared example sentences
+from ConferenceScraperApp.word_store import WordFeatures, DEFAULT_SENTENCE_LIMIT, SENTENCE_POLICIES, \
+    DEFAULT_SENTENCE_POLICY
+# Output formats
+from ConferenceScraperApp.output import OUTPUT_FORMATS, GROUP_BY, get_columns, open_output, write_rows
+# Raw pages kept between runs
+from ConferenceScraperApp.page_cache import PageCache, get_page_cache_path, DEFAULT_PAGE_MAX_AGE
+# Bounded queues between the fetch, extract, annotate and aggregate stages
+from ConferenceScraperApp.pipeline import Pipeline, SESSION_START, SESSION_END, DEFAULT_QUEUE_SIZE
+# Per-talk word counts for queries
+from ConferenceScraperApp.frequency_index import FrequencyIndex, get_frequency_index_path, get_session_key
+# Wall time, calls and bytes of each stage for --profile
+from ConferenceScraperApp.profiling import Profiler, measure, record
+# Memoized lemma and transliteration lookups
+from ConferenceScraperApp.tokens import TokenCache, TOKEN_CACHE_SIZE, get_token_cache_path, load_token_caches, \
+    save_token_caches
+# Talk page extraction
+from ConferenceScraperApp.extract import HTML_PARSERS, extract_talk, extract_talk_bs4
 # Translation
-from googletrans import Translator
-# Linguistic Processing
-import stanza
-# Linguistic processing for other languages
-from nltk import sent_tokenize, word_tokenize
-import simplemma
+from ConferenceScraperApp.translation import Translations, GoogleTranslateBackend, DictionaryBackend, \
+    TranslationCache, get_translation_cache_path
+# Session claims shared by the processes and machines using a cache directory
+from ConferenceScraperApp.claims import DEFAULT_CLAIM_TIMEOUT, CLAIM_POLL_SECONDS, acquire_claim, get_claim_path, \
+    get_claim_owner
 # read and write json
 import json
+# Worker processes for the linguistic processing
+import multiprocessing
+# Threads downloading the talk pages
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import functools
+import itertools
+import time
+
+
+# ISO 639 information
+available_languages = {
+    "bul": {
+        "iso_name": "Bulgarian",
+        "iso_one": "bg",
+        "pos": True,
+        "lemma": True
+    },
+    "deu": {
+        "iso_name": "German",
+        "iso_one": "de",
+        "pos": True,
+        "lemma": True
+    },
+    "eng": {
+        "iso_name": "English",
+        "iso_one": "en",
+        "pos": True,
+        "lemma": True
+    },
+    "spa": {
+        "iso_name": "Spanish",
+        "iso_one": "es",
+        "pos": True,
+        "lemma": True
+    },
+    "fra": {
+        "iso_name": "French",
+        "iso_one": "fr",
+        "pos": True,
+        "lemma": True
+    },
+    "kor": {
+        "iso_name": "Korean",
+        "iso_one": "ko",
+        "pos": True,
+        "lemma": True
+    },
+    "ita": {
+        "iso_name": "Italian",
+        "iso_one": "it",
+        "pos": True,
+        "lemma": True
+    },
+    "por": {
+        "iso_name": "Portuguese",
+        "iso_one": "pt",
+        "pos": True,
+        "lemma": True
+    },
+    "rus": {
+        "iso_name": "Russian",
+        "iso_one": "ru",
+        "pos": True,
+        "lemma": True
+    },
+    "zho": {
+        "iso_name": "Chinese (Mandarin)",
+        "iso_one": "zh",
+        "pos": True,
+        "lemma": True
+    },
+    "jpn": {
+        "iso_name": "Japanese",
+        "iso_one": "ja",
+        "pos": True,
+        "lemma": True
+    },
+    "ceb": {
+        "iso_name": "Cebuano",
+        "iso_one": "",
+        "pos": False,
+        "lemma": False
+    },
+    "hil": {
+        "iso_name": "Hiligaynon",
+        "iso_one": "",
+        "pos": False,
+        "lemma": False
+    },
+    "ilo": {
+        "iso_name": "Ilokano",
+        "iso_one": "",
+        "pos": False,
+        "lemma": False
+    },
+    "smo": {
+        "iso_name": "Samoan",
+        "iso_one": "sm",
+        "pos": False,
+        "lemma": False
+    },
+    "tgl": {
+        "iso_name": "Tagalog",
+        "iso_one": "tl",
+        "pos": False,
+        "lemma": False
+    },
+    "ton": {
+        "iso_name": "Tongan",
+        "iso_one": "to",
+        "pos": False,
+        "lemma": False
+    }
+}
+
+
+# state loaded once in each process of the --workers pool
+worker_state = {}
+# lemma and transliteration of each token for each language, shared by every session of that language
+token_caches = {}
+# parts of speech that aren't counted as words
+EXCLUDED_POS = frozenset(["PUNCT", "NUM", "AUX", "PROPN"])
 
 
 # provide the usage
 def usage():
     print("ConferenceScraper [-l <LANGUAGE>] [-y <YEAR>] [-m <MONTH>] [-o <OUTPUT>] "
           "[--includeLemma] [--includeTransliteration] [--translateMin <NUM>] [--translateMax <NUMBER>] "
-          "[--hideCount] [-v] [-h] [--showPOS] [--showSentence] [--cache]")
-    print("SUPPORTED LANGUAGES: bul, deu, eng, spa, fra, kor, ita, por, rus")
+          "[--hideCount] [-v] [-h] [--showPOS] [--showSentence] [--cache] "
+          "[--siteUrl <URL>] [--fetchWorkers <NUM>] [--rateLimit <SECONDS>] [--retries <NUM>] "
+          "[--batchSize <NUM>] [--workers <NUM>] [--cacheFormat <json|sqlite>] "
+          "[--incremental] [--sentenceLimit <NUM>] [--sentencePolicy <random|shortest|representative>] "
+          "[--seed <NUM>] "
+          "[--format <tsv|csv|jsonl|anki>] [--limit <NUM>] [--translationDictionary <FILE>] "
+          "[--translationWorkers <NUM>] [--htmlParser <fast|bs4>] "
+          "[--pageMaxAge <SECONDS>] [--queueSize <NUM>] [--tokenCacheSize <NUM>] [--persistTokenCache] "
+          "[--groupBy <word|lemma|lemmapos|session>] [--frequencyIndex] [--profile <FILE>] [--profileDump <FILE>] "
+          "[--languageWorkers <NUM>] [--sessionWorkers <NUM>] [--claimTimeout <SECONDS>] [--serve <[HOST:]PORT>]")
+    print("SUPPORTED LANGUAGES: %s, several separated by commas or all" % ", ".join(available_languages))
     print("SUPPORTED YEAR FORMATS: yyyy or yyyy-yyyy or yyyy,yyyy,yyyy")
     print("SUPPORTED MONTHS: 04 or 10 or 04,10")
     print("DEFAULT: ConferenceScraper -l eng -y <CURRENT_YEAR> -m 04,10")
     print("EXAMPLE Spanish from 2019-2021 to file: ConferenceScraper -l spa -y 2019-2021 -o output.txt")
+    print("EXAMPLE Spanish and Portuguese to output_spa.txt and output_por.txt: "
+          "ConferenceScraper -l spa,por -y 2019-2021 -o output.txt")
+    print("EXAMPLE serve word lists at http://127.0.0.1:8080/words with the Spanish model loaded: "
+          "ConferenceScraper --serve 8080 -l spa --cache cache")
 
 
-def run(argv):
+def run(argv, web_client=None, checkpoint=False, models=None):
     """
     # Unsupported by stanza
 
-    """
-    # ISO 639 information
-    available_languages = {
-        "bul": {
-            "iso_name": "Bulgarian",
-            "iso_one": "bg",
-            "pos": True,
-            "lemma": True
-        },
-        "deu": {
-            "iso_name": "German",
-            "iso_one": "de",
-            "pos": True,
-            "lemma": True
-        },
-        "eng": {
-            "iso_name": "English",
-            "iso_one": "en",
-            "pos": True,
-            "lemma": True
-        },
-        "spa": {
-            "iso_name": "Spanish",
-            "iso_one": "es",
-            "pos": True,
-            "lemma": True
-        },
-        "fra": {
-            "iso_name": "French",
-            "iso_one": "fr",
-            "pos": True,
-            "lemma": True
-        },
-        "kor": {
-            "iso_name": "Korean",
-            "iso_one": "ko",
-            "pos": True,
-            "lemma": True
-        },
-        "ita": {
-            "iso_name": "Italian",
-            "iso_one": "it",
-            "pos": True,
-            "lemma": True
-        },
-        "por": {
-            "iso_name": "Portuguese",
-            "iso_one": "pt",
-            "pos": True,
-            "lemma": True
-        },
-        "rus": {
-            "iso_name": "Russian",
-            "iso_one": "ru",
-            "pos": True,
-            "lemma": True
-        },
-        "zho": {
-            "iso_name": "Chinese (Mandarin)",
-            "iso_one": "zh",
-            "pos": True,
-            "lemma": True
-        },
-        "jpn": {
-            "iso_name": "Japanese",
-            "iso_one": "ja",
-            "pos": True,
-            "lemma": True
-        },
-        "ceb": {
-            "iso_name": "Cebuano",
-            "iso_one": "",
-            "pos": False,
-            "lemma": False
-        },
-        "hil": {
-            "iso_name": "Hiligaynon",
-            "iso_one": "",
-            "pos": False,
-            "lemma": False
-        },
-        "ilo": {
-            "iso_name": "Ilokano",
-            "iso_one": "",
-            "pos": False,
-            "lemma": False
-        },
-        "smo": {
-            "iso_name": "Samoan",
-            "iso_one": "sm",
-            "pos": False,
-            "lemma": False
-        },
-        "tgl": {
-            "iso_name": "Tagalog",
-            "iso_one": "tl",
-            "pos": False,
-            "lemma": False
-        },
-        "ton": {
-            "iso_name": "Tongan",
-            "iso_one": "to",
-            "pos": False,
-            "lemma": False
-        }
-    }
+    When several languages are processed at once each of them is run with a
+    web_client shared by all of them. models keeps the loaded models from one
+    run to the next when the runs come from --serve.
 
+    With --sessionWorkers each session is first run on its own with
+    checkpoint set, which only claims, processes and saves that session and
+    returns whether it is done, or False when another process claimed it.
+    """
     # ISO 639-2 Code
     lang = "eng"
+    # every language to process, only one unless -l lists several
+    languages = [lang]
+    language_workers = None
     # four digit year, two four digit years separated by -, list of four digit year separated by comma
     year = str(date.today().year)
     # should be 04, 10, or 04,10
@@ -165,13 +221,50 @@ def run(argv):
     show_pos = False
     show_sentence = False
     cache_directory = None
+    cache_format = "json"
+    incremental = False
+    sentence_limit = DEFAULT_SENTENCE_LIMIT
+    sentence_policy = DEFAULT_SENTENCE_POLICY
+    seed = None
+    output_format = "tsv"
+    limit = None
+    translation_dictionary = None
+    translation_workers = 4
+    site_url = "https://www.churchofjesuschrist.org"
+    fetch_workers = 8
+    rate_limit = 0.1
+    retries = 3
+    batch_size = 32
+    workers = 1
+    html_parser = "fast"
+    page_max_age = DEFAULT_PAGE_MAX_AGE
+    queue_size = DEFAULT_QUEUE_SIZE
+    token_cache_size = TOKEN_CACHE_SIZE
+    persist_token_cache = False
+    group_by = "word"
+    frequency_index = None
+    build_frequency_index = False
+    profile_path = None
+    profile_dump_path = None
+    session_workers = None
+    claim_timeout = DEFAULT_CLAIM_TIMEOUT
+    serve = None
 
     # process the input from the command line
     try:
         opts, args = getopt.getopt(argv, "l:y:m:o:hv", ["language=", "year=", "month=", "output=", "verbose",
                                                         "includeLemma", "includeTransliteration", "translateMin=",
                                                         "translateMax=", "hideCount", "showPOS", "showSentence",
-                                                        "cache="])
+                                                        "cache=", "siteUrl=", "fetchWorkers=", "rateLimit=",
+                                                        "retries=", "batchSize=", "workers=",
+                                                        "cacheFormat=", "incremental",
+                                                        "sentenceLimit=", "sentencePolicy=", "seed=",
+                                                        "format=", "limit=",
+                                                        "translationDictionary=", "translationWorkers=", "htmlParser=",
+                                                        "pageMaxAge=", "queueSize=", "tokenCacheSize=",
+                                                        "persistTokenCache", "groupBy=", "frequencyIndex", "profile=",
+                                                        "profileDump=", "languageWorkers=", "sessionWorkers=",
+                                                        "claimTimeout=", "serve="])
     except getopt.GetoptError as err:
         print(err)
         usage()
@@ -181,14 +274,15 @@ def run(argv):
             usage()
             sys.exit()
         elif opt in ("-l", "--language"):
-            lang = arg
-            if lang not in available_languages.keys():
-                assert False, "Language unavailable. Please choose from %s" % available_languages.keys()
+            languages = parse_languages(arg)
+            if languages is None:
+                assert False, "Language unavailable. Please choose from %s or all" % available_languages.keys()
+            lang = languages[0]
         elif opt in ("-y", "--year"):
             year = arg.replace(" ", "")
         elif opt in ("-m", "--month"):
             month = arg.replace(" ", "")
-        elif opt == ("-v", "--verbose"):
+        elif opt in ("-v", "--verbose"):
             verbose = True
         elif opt in ("-o", "--output"):
             output = arg
@@ -213,36 +307,109 @@ def run(argv):
                 cache_directory = path
             else:
                 assert False, "Cache directory doesn't exist"
+        elif opt == "--siteUrl":
+            site_url = arg.rstrip("/")
+        elif opt == "--fetchWorkers":
+            fetch_workers = int(arg)
+            if fetch_workers < 1:
+                assert False, "fetchWorkers must be at least 1"
+        elif opt == "--rateLimit":
+            rate_limit = float(arg)
+        elif opt == "--retries":
+            retries = int(arg)
+        elif opt == "--batchSize":
+            batch_size = int(arg)
+            if batch_size < 1:
+                assert False, "batchSize must be at least 1"
+        elif opt == "--workers":
+            workers = int(arg)
+            if workers < 1:
+                assert False, "workers must be at least 1"
+        elif opt == "--cacheFormat":
+            cache_format = arg
+            if cache_format not in ("json", "sqlite"):
+                assert False, "cacheFormat must be json or sqlite"
+        elif opt == "--incremental":
+            incremental = True
+        elif opt == "--sentenceLimit":
+            sentence_limit = int(arg)
+            if sentence_limit < 1:
+                assert False, "sentenceLimit must be at least 1"
+        elif opt == "--sentencePolicy":
+            sentence_policy = arg
+            if sentence_policy not in SENTENCE_POLICIES:
+                assert False, "sentencePolicy must be one of %s" % ", ".join(SENTENCE_POLICIES)
+        elif opt == "--seed":
+            seed = int(arg)
+        elif opt == "--format":
+            output_format = arg
+            if output_format not in OUTPUT_FORMATS:
+                assert False, "format must be one of %s" % ", ".join(OUTPUT_FORMATS)
+        elif opt == "--limit":
+            limit = int(arg)
+            if limit < 1:
+                assert False, "limit must be at least 1"
+        elif opt == "--translationDictionary":
+            translation_dictionary = arg
+            if not os.path.isfile(translation_dictionary):
+                assert False, "Translation dictionary doesn't exist"
+        elif opt == "--translationWorkers":
+            translation_workers = int(arg)
+            if translation_workers < 1:
+                assert False, "translationWorkers must be at least 1"
+        elif opt == "--htmlParser":
+            html_parser = arg
+            if html_parser not in HTML_PARSERS:
+                assert False, "htmlParser must be one of %s" % ", ".join(HTML_PARSERS)
+        elif opt == "--pageMaxAge":
+            page_max_age = float(arg)
+        elif opt == "--queueSize":
+            queue_size = int(arg)
+            if queue_size < 1:
+                assert False, "queueSize must be at least 1"
+        elif opt == "--tokenCacheSize":
+            token_cache_size = int(arg)
+            if token_cache_size < 0:
+                assert False, "tokenCacheSize can't be negative"
+        elif opt == "--persistTokenCache":
+            persist_token_cache = True
+        elif opt == "--groupBy":
+            group_by = arg
+            if group_by not in GROUP_BY:
+                assert False, "groupBy must be one of %s" % ", ".join(GROUP_BY)
+        elif opt == "--frequencyIndex":
+            build_frequency_index = True
+        elif opt == "--profile":
+            profile_path = arg
+        elif opt == "--profileDump":
+            profile_dump_path = arg
+        elif opt == "--languageWorkers":
+            language_workers = int(arg)
+            if language_workers < 1:
+                assert False, "languageWorkers must be at least 1"
+        elif opt == "--sessionWorkers":
+            session_workers = int(arg)
+            if session_workers < 1:
+                assert False, "sessionWorkers must be at least 1"
+        elif opt == "--claimTimeout":
+            claim_timeout = float(arg)
+            if claim_timeout <= 0:
+                assert False, "claimTimeout must be more than 0"
+        elif opt == "--serve":
+            serve = parse_address(arg)
+            if serve is None:
+                assert False, "serve must be a port or host:port"
         else:
             assert False, "unhandled option"
 
     if verbose:
         print("RUNNING IN VERBOSE")
 
-    # check the years variable and process as needed
-    years = []
-    if m := re.match(r"(\d\d\d\d)-(\d\d\d\d)", year):
-        start_year = int(m.group(1))
-        end_year = int(m.group(2))
-        while start_year <= end_year:
-            years.append(str(start_year))
-            start_year += 1
-    elif "," in year:
-        years = year.split(",")
-    elif re.match(r"\d\d\d\d", year):
-        years.append(year)
-
-    # check the months variable and process as needed
-    months = []
-    if "," in month:
-        months = month.split(",")
-    elif re.match(r"\d\d", month):
-        if month == "04" or month == "10":
-            months.append(month)
-        else:
-            month = None
-    else:
+    years = parse_years(year)
+    months = parse_months(month)
+    if months is None:
         month = None
+        months = []
 
     if min_translation > 0 and max_translation is None:
         max_translation = min_translation
@@ -264,9 +431,67 @@ def run(argv):
     if month is None:
         arg_error = True
         print("No month specified")
+    if incremental and cache_directory is None:
+        arg_error = True
+        print("--incremental requires --cache")
+    if build_frequency_index and cache_directory is None:
+        arg_error = True
+        print("--frequencyIndex requires --cache")
+    if persist_token_cache and cache_directory is None:
+        arg_error = True
+        print("--persistTokenCache requires --cache")
+    if session_workers is not None and cache_directory is None:
+        arg_error = True
+        print("--sessionWorkers requires --cache")
+    # the sessions a server processes are run with the options it was started with
+    if checkpoint:
+        serve = None
+    if len(languages) > 1 and output is None and serve is None:
+        arg_error = True
+        print("Processing several languages requires -o")
+    if serve is not None and cache_directory is None:
+        arg_error = True
+        print("--serve requires --cache")
+    if serve is not None and workers > 1:
+        arg_error = True
+        print("--serve processes the sessions with the models it keeps loaded and doesn't use --workers")
     if arg_error:
         usage()
         sys.exit(2)
+    # the sessions are saved as they finish and merged at the end
+    if session_workers is not None:
+        incremental = True
+
+    if serve is not None:
+        from ConferenceScraperApp.server import serve_words
+        web_client = create_web_client(cache_directory, fetch_workers, rate_limit, retries, page_max_age, verbose)
+        try:
+            serve_words(serve, argv, languages, cache_directory, web_client, show_lemma, show_transliteration,
+                        sentence_limit, seed, sentence_policy, translation_dictionary, translation_workers, verbose)
+        finally:
+            web_client.close()
+        return
+    # a session run on its own leaves the profile to the run that merges it
+    if checkpoint:
+        profile_path = None
+        profile_dump_path = None
+
+    if len(languages) > 1:
+        if language_workers is None:
+            language_workers = min(len(languages), os.cpu_count() or 1)
+        run_languages(argv, languages, language_workers, output, profile_path, profile_dump_path, cache_directory,
+                      fetch_workers, rate_limit, retries, page_max_age, verbose)
+        return
+
+    # the profiler is started before anything is loaded so the report covers the whole run
+    profiler = Profiler() if profile_path is not None else None
+    profiles = None
+    main_profile = None
+    if profile_dump_path is not None:
+        import cProfile
+        main_profile = cProfile.Profile()
+        profiles = [main_profile]
+        main_profile.enable()
 
     # Get the 639-1 code for the language
     iso_one = available_languages[lang]["iso_one"]
@@ -274,186 +499,864 @@ def run(argv):
 
     transliteration_languages = None
     if show_transliteration:
+        from transliterate import get_available_language_codes
         transliteration_languages = get_available_language_codes()
     show_transliteration = show_transliteration and transliteration_languages is not None and iso_one in transliteration_languages
 
-    # Setup stanza/NLTK for the target language
+    # Setup stanza/NLTK for the target language. With a worker pool each worker loads its own copy
+    # and the parent only makes sure the stanza model has been downloaded.
     nlp = None
     language_data = None
-    if pos_support:
+    pool = None
+    annotation_cache = None
+    annotation_cache_path = None
+    session_store = None
+    aggregate_store = None
+    aggregate_key = None
+    claim = None
+    own_web_client = None
+    try:
+        if cache_directory is not None:
+            annotation_cache_path = get_annotation_cache_path(cache_directory)
+            if build_frequency_index:
+                frequency_index = FrequencyIndex(get_frequency_index_path(cache_directory))
+            if incremental:
+                aggregate_store = AggregateStore(get_aggregate_store_path(cache_directory))
+                aggregate_key = aggregate_store.get_settings_key(get_pipeline_key(pos_support, iso_one, show_lemma),
+                                                                 show_transliteration)
+                pending = None
+                if checkpoint or session_workers is not None:
+                    pending = [(year, month) for year in years for month in months
+                               if not is_session_stored(aggregate_store, aggregate_key, frequency_index, lang, year,
+                                                        month)]
+                if checkpoint:
+                    # only one of the processes sharing the cache directory processes the session
+                    if len(pending) == 0:
+                        return True
+                    claim_path = get_claim_path(cache_directory, lang, years[0], months[0], aggregate_key)
+                    claim = acquire_claim(claim_path, claim_timeout)
+                    if claim is None:
+                        print("%s %s is being processed by %s" % (months[0], years[0],
+                                                                  get_claim_owner(claim_path)))
+                        return False
+                    # the process that held the claim may have stored the session just before releasing it
+                    if is_session_stored(aggregate_store, aggregate_key, frequency_index, lang, years[0], months[0]):
+                        return True
+                elif session_workers is not None and len(pending) > 0:
+                    run_sessions(argv, pending, session_workers, claim_timeout)
+            if cache_format == "sqlite":
+                session_store = SessionStore(get_session_store_path(cache_directory))
+        # the lemma and transliteration caches last for the whole run and optionally from one run to the next
+        token_cache_path = None
+        token_cache_key = None
+        if persist_token_cache:
+            token_cache_path = get_token_cache_path(cache_directory, lang)
+            token_cache_key = get_token_cache_key(pos_support, iso_one, show_lemma)
+        language_token_caches = init_token_caches(iso_one, token_cache_size, token_cache_path, token_cache_key)
+        if workers > 1:
+            # make sure the model is there before the workers start so they don't all download it at once
+            if pos_support:
+                download_stanza_model(iso_one)
+            pool = multiprocessing.get_context("spawn").Pool(workers, initializer=init_worker,
+                                                             initargs=(pos_support, iso_one, show_lemma,
+                                                                       show_transliteration, batch_size,
+                                                                       annotation_cache_path, sentence_limit, seed,
+                                                                       token_cache_size, token_cache_path,
+                                                                       token_cache_key))
+        else:
+            nlp, language_data = get_language_processing(models, pos_support, iso_one, show_lemma)
+            if annotation_cache_path is not None:
+                annotation_cache = AnnotationCache(annotation_cache_path,
+                                                   get_pipeline_key(pos_support, iso_one, show_lemma))
+
+        # the final dictionaries we are going to output. Will contain a word as a key along with a count
+        word_features = WordFeatures(sentence_limit, seed=seed)
+        word_list = word_features.counts
+
+        # Get the url setup
+        lang_url = lang
+
+        transliteration_languages = None
+        if show_transliteration:
+            from transliterate import get_available_language_codes
+            transliteration_languages = get_available_language_codes()
+        show_transliteration = show_transliteration and transliteration_languages is not None and iso_one in transliteration_languages
+
+        # every session goes through the pipeline in order: the ones with stored counts are only merged, the
+        # cached ones are read from the cache and the rest are downloaded while earlier talks are processed
+        sessions = []
+        for year in years:
+            for month in months:
+                if is_session_stored(aggregate_store, aggregate_key, frequency_index, lang, year, month):
+                    sessions.append((year, month, "aggregate"))
+                elif check_session_cached(cache_directory, session_store, lang, year, month):
+                    sessions.append((year, month, "cache"))
+                else:
+                    sessions.append((year, month, "web"))
+        web_count = len([session for session in sessions if session[2] == "web"])
+        if web_count > 0:
+            print("Downloading %s session(s)" % web_count)
+            if web_client is None:
+                own_web_client = web_client = create_web_client(cache_directory, fetch_workers, rate_limit, retries,
+                                                                page_max_age, verbose)
+
+        pipeline = Pipeline(queue_size, profiles)
+        pipeline.add_source("fetch", iter_sessions(sessions, lang_url, cache_directory, cache_format, site_url,
+                                                   web_client, html_parser, profiler))
+        pipeline.add_stage("extract", functools.partial(extract_page, extract_talk_bs4 if html_parser == "bs4"
+                                                        else extract_talk, profiler))
+        pipeline.add_stage("annotate", functools.partial(annotate_talk, pos_support, nlp, language_data, iso_one,
+                                                         show_lemma, batch_size, pool, annotation_cache, profiler))
+
+        from tqdm import tqdm
+        session_list, session_features = word_list, word_features
+        # the word counts of each session for --groupBy session
+        session_counts = {}
+        counts_before = None
+        session_json = None
+        progress = None
+        session_key = None
+        session_started = None
+        for item in pipeline.run("aggregate"):
+            if item[0] == SESSION_START:
+                year, month, source, base_url = item[1]
+                session_key = get_session_key(year, month)
+                session_started = time.perf_counter()
+                print("Processing %s %s" % (month, year))
+                if source == "aggregate":
+                    if verbose:
+                        print("Merging the stored counts for %s %s" % (month, year))
+                    with measure(profiler, "merge", session_key):
+                        session_list, session_features = aggregate_store.load_session(lang, year, month, aggregate_key)
+                        word_list, word_features = merge_lists(word_list, word_features, session_list, session_features)
+                    if group_by == "session":
+                        # a copy of the counts so the session's features don't stay in memory along with them
+                        session_counts[session_key] = dict(session_list.items())
+                    # merging copies every sentence of the stored sample, also those it samples out
+                    word_features.trim_sentences()
+                    continue
+                if verbose:
+                    if source == "web":
+                        print("Begin processing %s/%s in %s ( %s )" % (month, year, lang_url, base_url))
+                    elif session_store is not None:
+                        print("Process %s %s %s from the session store" % (lang, year, month))
+                    else:
+                        print("Process file %s" % os.path.join(cache_directory, get_cache_filename(lang, year, month)))
+                # in incremental mode the session is processed on its own so its counts can be stored
+                session_features = WordFeatures(sentence_limit, seed=get_seed(seed, session_key)) \
+                    if aggregate_store is not None else word_features
+                session_list = session_features.counts
+                if group_by == "session" and aggregate_store is None:
+                    # the session is counted into the totals so its own counts are what it adds to them
+                    counts_before = dict(word_list.items())
+                if frequency_index is not None:
+                    frequency_index.begin_session(lang, year, month)
+                session_json = None
+                if source == "web" and cache_directory is not None:
+                    session_json = {
+                        "language": lang_url,
+                        "year": year,
+                        "month": month,
+                        "base_url": base_url,
+                        "talks": []
+                    }
+                progress = tqdm(unit=" talks")
+            elif item[0] == SESSION_END:
+                year, month, source, base_url = item[1]
+                if source == "aggregate":
+                    continue
+                progress.close()
+                if frequency_index is not None:
+                    with measure(profiler, "index", session_key):
+                        frequency_index.end_session()
+                if session_json is not None and len(session_json["talks"]) > 0:
+                    save_session_cache(cache_directory, session_store, session_json)
+                if aggregate_store is not None:
+                    # a session without talks (e.g. one that hasn't happened yet) is left out so it is tried again
+                    if len(session_list) > 0:
+                        aggregate_store.save_session(lang, year, month, aggregate_key, session_list, session_features)
+                    with measure(profiler, "merge", session_key):
+                        word_list, word_features = merge_lists(word_list, word_features, session_list, session_features)
+                    if group_by == "session":
+                        session_counts[session_key] = dict(session_list.items())
+                else:
+                    word_list, word_features = session_list, session_features
+                    if group_by == "session":
+                        session_counts[session_key] = {
+                            lcase: count - counts_before.get(lcase, 0) for lcase, count in word_list.items()
+                            if count != counts_before.get(lcase, 0)}
+                # the sentences the session sampled out are dropped before the next one adds its own
+                word_features.trim_sentences()
+                # the wall time of the session from its first talk coming out of the pipeline to its last
+                record(profiler, "session", time.perf_counter() - session_started, 0, session_key)
+            else:
+                kind, talk, annotated = item
+                if verbose:
+                    print("PROCESSING: %s " % talk["url"])
+                    print("%s\n%s\n%s\n%s" % (talk["title"], talk["speaker"], talk["role"], talk["summary"]))
+                    for talk_para in talk["paragraphs"]:
+                        print(talk_para["paragraph"])
+                if pool is not None:
+                    # the pool processed the talk into a partial list which is merged in talk order
+                    partial_list, partial_features, timings = annotated.get()
+                    if profiler is not None:
+                        profiler.record("annotate", timings["annotate"], get_text_size(talk), session_key, talk["url"])
+                        profiler.record("count", timings["count"], 0, session_key, talk["url"])
+                    with measure(profiler, "merge", session_key, talk["url"]):
+                        session_list, session_features = merge_lists(session_list, session_features,
+                                                                     partial_list, partial_features)
+                    talk_counts = partial_list
+                elif seed is not None:
+                    # counted on its own like in a pool worker, so --seed picks the same sentences with --workers
+                    with measure(profiler, "count", session_key, talk["url"]):
+                        partial_list, partial_features = count_talk(pos_support, annotated, iso_one,
+                                                                    show_transliteration, sentence_limit, seed,
+                                                                    talk["url"])
+                    with measure(profiler, "merge", session_key, talk["url"]):
+                        session_list, session_features = merge_lists(session_list, session_features,
+                                                                     partial_list, partial_features)
+                    talk_counts = partial_list
+                else:
+                    with measure(profiler, "count", session_key, talk["url"]):
+                        for annotation in annotated:
+                            session_list, session_features = process_annotation(pos_support, annotation, session_list,
+                                                                                session_features, iso_one,
+                                                                                show_transliteration)
+                    talk_counts = None
+                    if frequency_index is not None:
+                        talk_counts = {}
+                        for annotation in annotated:
+                            count_annotation(pos_support, annotation, talk_counts)
+                if frequency_index is not None:
+                    with measure(profiler, "index", session_key, talk["url"]):
+                        frequency_index.add_talk(talk, talk_counts)
+                if session_json is not None:
+                    session_json["talks"].append(talk)
+                if claim is not None:
+                    claim.refresh()
+                progress.update()
+
+        if verbose:
+            print(pipeline.report())
+            for name, cache in language_token_caches.items():
+                if cache.hits + cache.misses > 0:
+                    print("%s lookups: %s, cached: %s" % (name, cache.hits + cache.misses, cache.hits))
+        if token_cache_path is not None:
+            save_token_caches(token_cache_path, token_cache_key, language_token_caches)
+        if pool is not None:
+            pool.close()
+            pool.join()
+            pool = None
+    finally:
+        # an interrupted or failed run releases its claim so running again resumes at once
+        if pool is not None:
+            pool.terminate()
+        if own_web_client is not None:
+            own_web_client.close()
+        if annotation_cache is not None:
+            annotation_cache.close()
+        if session_store is not None:
+            session_store.close()
+        if aggregate_store is not None:
+            aggregate_store.close()
+        if frequency_index is not None:
+            frequency_index.close()
+        if claim is not None:
+            claim.release()
+    if checkpoint:
+        return True
+
+    translations = None
+    if show_translation:
+        translations = create_translations(translation_dictionary, translation_workers, cache_directory, lang)
+
+    if word_list is not None:
+        with measure(profiler, "output") as measured:
+            print_output(output, word_list, word_features,
+                         hide_count, show_transliteration, show_lemma,
+                         show_translation, show_pos, show_sentence,
+                         max_translation, min_translation, output_format, limit, translations,
+                         group_by, session_counts, iso_one, sentence_policy
+                         )
+            if output is not None:
+                measured["bytes"] = os.path.getsize(output)
+
+    if profiler is not None:
+        profiler.save(profile_path, {
+            "argv": argv,
+            "pipeline": pipeline.get_stats(),
+            "token_caches": {name: {"hits": cache.hits, "misses": cache.misses}
+                             for name, cache in language_token_caches.items()}
+        })
+    if main_profile is not None:
+        main_profile.disable()
+        import pstats
+        # the profiles of the main thread and every pipeline thread are added together
+        pstats.Stats(*profiles).dump_stats(profile_dump_path)
+
+
+class LazyPipeline:
+    """
+    Stands in for a stanza Pipeline and only loads it the first time a
+    paragraph actually has to be processed, so runs where every paragraph is
+    already in the annotation cache never load stanza or its models.
+    """
+
+    def __init__(self, iso_one):
+        self.iso_one = iso_one
+        self.pipeline = None
+
+    def get_pipeline(self):
+        if self.pipeline is None:
+            import stanza
+            from stanza.pipeline.core import DownloadMethod
+            # only download the resources and models when they aren't on disk yet
+            self.pipeline = stanza.Pipeline(lang=self.iso_one, processors='tokenize,pos,lemma',
+                                            download_method=DownloadMethod.REUSE_RESOURCES)
+        return self.pipeline
+
+    def __call__(self, paragraph):
+        return self.get_pipeline()(paragraph)
+
+    def bulk_process(self, paragraphs):
+        return self.get_pipeline().bulk_process(paragraphs)
+
+
+def download_stanza_model(iso_one):
+    import stanza
+    from stanza.resources.common import DEFAULT_MODEL_DIR
+    if not os.path.isdir(os.path.join(DEFAULT_MODEL_DIR, iso_one)):
         stanza.download(iso_one)
-        nlp = stanza.Pipeline(lang=iso_one, processors='tokenize,pos,lemma')
+
+
+def load_language_processing(pos_support, iso_one, show_lemma):
+    nlp = None
+    language_data = None
+    if pos_support:
+        nlp = LazyPipeline(iso_one)
     else:
         if show_lemma:
+            import simplemma
             language_data = simplemma.load_data(iso_one)
+    return nlp, language_data
 
-    # the final dictionaries we are going to output. Will contain a word as a key along with a count
-    word_list = {}
-    word_features = {}
 
-    # Get the url setup
-    lang_url = lang
-    site_url = "https://www.churchofjesuschrist.org"
+def get_language_processing(models, pos_support, iso_one, show_lemma):
+    # models is only given by --serve, which loads each model once and keeps it for every run after
+    if models is None:
+        return load_language_processing(pos_support, iso_one, show_lemma)
+    # stanza always loads the lemma processor, so only NLTK languages need a model for each show_lemma
+    key = (pos_support, iso_one, show_lemma and not pos_support)
+    if key not in models:
+        models[key] = load_language_processing(pos_support, iso_one, show_lemma)
+    return models[key]
 
-    transliteration_languages = None
-    if show_transliteration:
-        transliteration_languages = get_available_language_codes()
-    show_transliteration = show_transliteration and transliteration_languages is not None and iso_one in transliteration_languages
 
-    # iterate over one or more years
-    for year in years:
-        # iterate over one or more months
-        for month in months:
-            print("Processing %s %s" % (month, year))
-
-            cache_filename = None
-            if cache_directory is not None:
-                cache_filename = get_cache_filename(lang, year, month)
-
-            if cache_filename is not None and check_cache_exists(cache_directory, cache_filename):
-                word_list, word_features = process_session_cache(verbose, pos_support, nlp, language_data,
-                                                                 iso_one, show_lemma, show_transliteration,
-                                                                 cache_directory, cache_filename,
-                                                                 word_list, word_features)
-            else:
-                word_list, word_features = process_session_web(verbose, site_url, pos_support, nlp, language_data,
-                                                           iso_one, show_lemma, show_transliteration, year, month,
-                                                           lang_url, word_list, word_features, cache_directory)
+def create_translations(translation_dictionary, translation_workers, cache_directory, lang):
+    # translations come from the offline dictionary if one is given, otherwise from Google with a cache
+    if translation_dictionary is not None:
+        return Translations(DictionaryBackend(translation_dictionary), None, translation_workers)
+    translation_cache = None
+    if cache_directory is not None:
+        translation_cache = TranslationCache(get_translation_cache_path(cache_directory, lang, "en"))
+    return Translations(GoogleTranslateBackend(), translation_cache, translation_workers)
+
+
+def init_worker(pos_support, iso_one, show_lemma, show_transliteration, batch_size, annotation_cache_path,
+                sentence_limit, seed, token_cache_size, token_cache_path, token_cache_key):
+    # the parent has already downloaded the model so the workers only load it
+    # the workers start from the saved token caches but only the parent saves its own
+    init_token_caches(iso_one, token_cache_size, token_cache_path, token_cache_key)
+    nlp, language_data = load_language_processing(pos_support, iso_one, show_lemma)
+    annotation_cache = None
+    if annotation_cache_path is not None:
+        annotation_cache = AnnotationCache(annotation_cache_path,
+                                           get_pipeline_key(pos_support, iso_one, show_lemma))
+    worker_state.update({
+        "pos_support": pos_support,
+        "nlp": nlp,
+        "language_data": language_data,
+        "iso_one": iso_one,
+        "show_lemma": show_lemma,
+        "show_transliteration": show_transliteration,
+        "batch_size": batch_size,
+        "annotation_cache": annotation_cache,
+        "sentence_limit": sentence_limit,
+        "seed": seed
+    })
+
+
+def get_seed(seed, name):
+    # each talk or session gets a seed of its own so its sample doesn't depend on the order they were processed in
+    return None if seed is None else "%s %s" % (seed, name)
+
+
+def process_talk_worker(paragraphs, url):
+    """
+    Process the paragraphs of the talk at url inside a pool worker and return
+    the partial word_list and word_features for the parent to merge, along
+    with the time spent annotating and counting for --profile.
+    """
+    start = time.perf_counter()
+    annotations = annotate_paragraphs(worker_state["pos_support"], worker_state["nlp"],
+                                      worker_state["language_data"], paragraphs, worker_state["show_lemma"],
+                                      worker_state["batch_size"], worker_state["annotation_cache"],
+                                      worker_state["iso_one"])
+    annotated = time.perf_counter()
+    word_list, word_features = count_talk(worker_state["pos_support"], annotations, worker_state["iso_one"],
+                                          worker_state["show_transliteration"], worker_state["sentence_limit"],
+                                          worker_state["seed"], url)
+    timings = {"annotate": annotated - start, "count": time.perf_counter() - annotated}
+    return word_list, word_features, timings
+
+
+def count_talk(pos_support, annotations, iso_one, show_transliteration, sentence_limit, seed, url):
+    """
+    Count the annotations of the talk at url into a partial word_list and
+    word_features of its own, seeded from the talk, to be merged in talk
+    order. The sentences sampled from it are then the same whichever
+    process counted it.
+    """
+    word_features = WordFeatures(sentence_limit, seed=get_seed(seed, url))
+    word_list = word_features.counts
+    for annotation in annotations:
+        word_list, word_features = process_annotation(pos_support, annotation, word_list, word_features, iso_one,
+                                                      show_transliteration)
+    return word_list, word_features
 
-    if word_list is not None:
-        print_output(output, word_list, word_features,
-                     hide_count, show_transliteration, show_lemma,
-                     show_translation, show_pos, show_sentence,
-                     max_translation, min_translation
-                     )
+
+def init_token_caches(iso_one, token_cache_size, token_cache_path, token_cache_key):
+    caches = {"lemma": TokenCache(token_cache_size), "transliteration": TokenCache(token_cache_size)}
+    if token_cache_path is not None:
+        load_token_caches(token_cache_path, token_cache_key, caches)
+    token_caches[iso_one] = caches
+    return caches
+
+
+def get_token_caches(iso_one):
+    caches = token_caches.get(iso_one)
+    if caches is None:
+        caches = token_caches.setdefault(iso_one, {"lemma": TokenCache(), "transliteration": TokenCache()})
+    return caches
+
+
+def get_token_cache_key(pos_support, iso_one, show_lemma):
+    # the lemmas come from the annotation pipeline and the transliterations from transliterate
+    from importlib.metadata import version, PackageNotFoundError
+    try:
+        transliterate_version = version("transliterate")
+    except PackageNotFoundError:
+        transliterate_version = "none"
+    return "%s-transliterate-%s" % (get_pipeline_key(pos_support, iso_one, show_lemma), transliterate_version)
+
+
+def transliterate_word(word, iso_one):
+    from transliterate import translit
+    return translit(word, iso_one, reversed=True)
 
 
 def get_transliteration(word, iso_one, show_transliteration):
-    return translit(word, iso_one, reversed=True) if show_transliteration else ""
+    if not show_transliteration:
+        return ""
+    return get_token_caches(iso_one)["transliteration"].lookup(word, transliterate_word, iso_one)
 
 
-def process_paragraph_nltk(language_data, paragraph, word_list, word_features, iso_one, show_lemma, show_transliteration):
+def get_pipeline_key(pos_support, iso_one, show_lemma):
+    """
+    Describe the library versions, language and processors that produce the
+    annotations so cached annotations are only reused by the same pipeline.
+    """
+    # read the versions from the package metadata so the packages themselves don't have to be imported
+    from importlib.metadata import version
+    if pos_support:
+        return "stanza-%s-%s-tokenize,pos,lemma" % (version("stanza"), iso_one)
+    processors = "tokenize,lemma" if show_lemma else "tokenize"
+    return "nltk-%s-simplemma-%s-%s-%s" % (version("nltk"), version("simplemma"), iso_one, processors)
+
+
+def annotate_paragraph_nltk(language_data, paragraph, show_lemma, iso_one):
+    from nltk import sent_tokenize, word_tokenize
+    import simplemma
+    lemma_cache = get_token_caches(iso_one)["lemma"] if show_lemma and language_data else None
+    annotation = []
     sentences = sent_tokenize(paragraph)
     for sentence in sentences:
         if sentence:
             words = word_tokenize(sentence)
-            for word in words:
-                if len(word) == 1 and re.search(r"\W*", word):
-                    continue
+            annotation.append({
+                "text": sentence,
+                "words": [[word, "", "", "", "",
+                           lemma_cache.lookup(word, simplemma.lemmatize, language_data) if lemma_cache else ""]
+                          for word in words]
+            })
+    return annotation
 
-                lcase = word.lower()
 
-                if lcase not in word_list:
-                    word_list, word_features = create_lists(lcase, word_list, word_features, word, sentence,
-                                                            "", "", "", "", simplemma.lemmatize(word, language_data) if show_lemma and language_data else "",
-                                                            get_transliteration(word, iso_one, show_transliteration))
-                else:
-                    word_list, word_features = update_lists(lcase, word_list, word_features, word, sentence)
+def annotate_doc_stanza(doc):
+    return [{
+        "text": sentence.text,
+        "words": [[word.text, word.pos, word.upos, word.xpos, word.feats, word.lemma] for word in sentence.words]
+    } for sentence in doc.sentences]
+
+
+def annotate_paragraphs_stanza(nlp, paragraphs, batch_size):
+    """
+    Run the paragraphs through stanza in groups of batch_size documents so the
+    models work on large batches instead of one small paragraph at a time. The
+    documents come back in the same order so the lists are updated exactly as
+    they would be paragraph by paragraph.
+    """
+    if batch_size <= 1:
+        return [annotate_doc_stanza(nlp(paragraph)) for paragraph in paragraphs]
+
+    annotations = []
+    for start in range(0, len(paragraphs), batch_size):
+        docs = nlp.bulk_process(paragraphs[start:start + batch_size])
+        annotations.extend(annotate_doc_stanza(doc) for doc in docs)
+    return annotations
+
+
+def annotate_paragraphs(pos_support, nlp, language_data, paragraphs, show_lemma, batch_size, annotation_cache,
+                        iso_one):
+    cached = annotation_cache.get_many(paragraphs) if annotation_cache is not None else [None] * len(paragraphs)
+    missing = [paragraph for paragraph, annotation in zip(paragraphs, cached) if annotation is None]
+    if len(missing) == 0:
+        return cached
+
+    if pos_support:
+        new_annotations = annotate_paragraphs_stanza(nlp, missing, batch_size)
+    else:
+        new_annotations = [annotate_paragraph_nltk(language_data, paragraph, show_lemma, iso_one)
+                           for paragraph in missing]
+    if annotation_cache is not None:
+        annotation_cache.put_many(missing, new_annotations)
+
+    new_annotations = iter(new_annotations)
+    return [annotation if annotation is not None else next(new_annotations) for annotation in cached]
+
+
+def process_annotation(pos_support, annotation, word_list, word_features, iso_one, show_transliteration):
+    for sentence in annotation:
+        for word, pos, upos, xpos, feats, lemma in sentence["words"]:
+            if pos_support:
+                if pos in EXCLUDED_POS:
+                    continue
+            # \W* matches every string so only the length of the token decides
+            elif len(word) == 1:
+                continue
+
+            lcase = word.lower()
+            if lcase not in word_list:
+                word_list, word_features = create_lists(lcase, word_list, word_features, word, sentence["text"],
+                                                        pos, upos, xpos, feats, lemma,
+                                                        get_transliteration(word, iso_one, show_transliteration))
+            else:
+                word_list, word_features = update_lists(lcase, word_list, word_features, word, sentence["text"])
+            word_features.count_lemma(lcase, lemma, upos)
     return word_list, word_features
 
 
-def process_paragraph_stanza(nlp, paragraph, word_list, word_features, iso_one, show_transliteration):
-    exclude_pos = ["PUNCT", "NUM", "AUX", "PROPN"]
-    doc = nlp(paragraph)
-    for i, sentence in enumerate(doc.sentences):
-        for word in sentence.words:
-            if word.pos not in exclude_pos:
-                lcase = word.text.lower()
-                if lcase not in word_list:
-                    word_list, word_features = create_lists(lcase, word_list, word_features, word.text, sentence.text,
-                                                            word.pos, word.upos, word.xpos, word.feats, word.lemma,
-                                                            get_transliteration(word.text, iso_one, show_transliteration))
-                else:
-                    word_list, word_features = update_lists(lcase, word_list, word_features, word, sentence.text)
+def count_annotation(pos_support, annotation, counts):
+    # count the same words as process_annotation without keeping their features
+    for sentence in annotation:
+        for word, pos, upos, xpos, feats, lemma in sentence["words"]:
+            if pos_support:
+                if pos in EXCLUDED_POS:
+                    continue
+            elif len(word) == 1:
+                continue
+            lcase = word.lower()
+            counts[lcase] = counts.get(lcase, 0) + 1
+    return counts
+
+
+def process_paragraphs(pos_support, nlp, language_data, paragraphs, word_list, word_features,
+                       iso_one, show_lemma, show_transliteration, batch_size, annotation_cache):
+    annotations = annotate_paragraphs(pos_support, nlp, language_data, paragraphs, show_lemma, batch_size,
+                                      annotation_cache, iso_one)
+    for annotation in annotations:
+        word_list, word_features = process_annotation(pos_support, annotation, word_list, word_features,
+                                                      iso_one, show_transliteration)
     return word_list, word_features
 
 
 def create_lists(lcase, word_list, word_features, word, sentence, pos, upos, xpos, feats, lemma, transliteration):
     word_list[lcase] = 1
 
-    word_features[lcase] = {
-        'raw': [word],
-        'sentences': [sentence],
-        'pos': pos,
-        'upos': upos,
-        'xpos': xpos,
-        'feats': feats,
-        'lemma': lemma,
-        'transliteration': transliteration
-    }
+    word_features[lcase] = word_features.new_entry(word, sentence, pos, upos, xpos, feats, lemma, transliteration)
     return word_list, word_features
 
 
 def update_lists(lcase, word_list, word_features, word, sentence):
     word_list[lcase] += 1
-    if word not in word_features[lcase]['raw']:
-        word_features[lcase]['raw'].append(word)
-    if sentence not in word_features[lcase]['sentences']:
-        word_features[lcase]['sentences'].append(sentence)
+    features = word_features[lcase]
+    # a word only has a handful of raw forms so the list stays short
+    if word not in features.raw:
+        features.raw.append(word)
+    word_features.add_sentence(features, sentence)
     return word_list, word_features
 
 
+def merge_lists(word_list, word_features, partial_list, partial_features):
+    """
+    Merge the counts and features of a partial run into the totals. Merging the
+    partials in the order they were processed gives the same counts and
+    features as processing everything in a single pass. The example sentences
+    are merged as a weighted sample.
+    """
+    for lcase, count in partial_list.items():
+        features = partial_features[lcase]
+        if lcase not in word_list:
+            word_list[lcase] = count
+            word_features[lcase] = word_features.import_entry(partial_features, features)
+        else:
+            word_list[lcase] += count
+            word_features.merge_entry(word_features[lcase], partial_features, features)
+    word_features.merge_lemmas(partial_features)
+    return word_list, word_features
+
+
+def parse_years(year):
+    # four digit year, two four digit years separated by -, list of four digit year separated by comma
+    years = []
+    if m := re.match(r"(\d\d\d\d)-(\d\d\d\d)", year):
+        start_year = int(m.group(1))
+        end_year = int(m.group(2))
+        while start_year <= end_year:
+            years.append(str(start_year))
+            start_year += 1
+    elif "," in year:
+        years = year.split(",")
+    elif re.match(r"\d\d\d\d", year):
+        years.append(year)
+    return years
+
+
+def parse_months(month):
+    # 04, 10, or 04,10. None when the months aren't valid
+    months = []
+    if "," in month:
+        months = month.split(",")
+    elif re.match(r"\d\d", month):
+        if month == "04" or month == "10":
+            months.append(month)
+        else:
+            return None
+    else:
+        return None
+    return months
+
+
+def parse_address(address):
+    # a port, or a host and port separated by a colon. None when it isn't valid
+    host, _, port = address.rpartition(":")
+    if not port.isdigit():
+        return None
+    return host or "127.0.0.1", int(port)
+
+
+def parse_languages(language):
+    # a single language, several separated by commas or all of them, None if any of them is unknown
+    if language == "all":
+        return list(available_languages)
+    languages = list(dict.fromkeys(lang.strip() for lang in language.split(",") if lang.strip()))
+    if len(languages) == 0 or any(lang not in available_languages for lang in languages):
+        return None
+    return languages
+
+
+def get_language_path(path, lang):
+    # output.txt becomes output_spa.txt, or {lang} in the path is replaced with the language
+    if "{lang}" in path:
+        return path.replace("{lang}", lang)
+    root, extension = os.path.splitext(path)
+    return "%s_%s%s" % (root, lang, extension)
+
+
+def create_web_client(cache_directory, fetch_workers, rate_limit, retries, page_max_age, verbose):
+    from ConferenceScraperApp import fetch
+    # keep the raw pages in the cache directory so a rerun only downloads what is missing or changed
+    page_cache = None
+    if cache_directory is not None:
+        page_cache = PageCache(get_page_cache_path(cache_directory), page_max_age)
+    return fetch.WebClient(fetch_workers, rate_limit, retries, page_cache, verbose)
+
+
+def split_threads(runs):
+    # split the cores between the runs going at once instead of each model using all of them
+    if runs > 1:
+        os.environ.setdefault("OMP_NUM_THREADS", str(max(1, (os.cpu_count() or 1) // runs)))
+
+
+def run_languages(argv, languages, language_workers, output, profile_path, profile_dump_path, cache_directory,
+                  fetch_workers, rate_limit, retries, page_max_age, verbose):
+    """
+    Process several languages in one run, language_workers of them at a time.
+    Each language is run with the same options and its own -l, output and
+    profile paths, so it keeps its own counts, loads its own models once and
+    writes its own output, while the downloads of every language share one
+    web client.
+    """
+    web_client = create_web_client(cache_directory, fetch_workers, rate_limit, retries, page_max_age, verbose)
+    split_threads(language_workers)
+
+    def run_language(lang):
+        # the options given last win so these replace the ones that named every language
+        language_argv = argv + ["-l", lang, "-o", get_language_path(output, lang)]
+        if profile_path is not None:
+            language_argv += ["--profile", get_language_path(profile_path, lang)]
+        if profile_dump_path is not None:
+            language_argv += ["--profileDump", get_language_path(profile_dump_path, lang)]
+        print("Start processing %s" % lang)
+        run(language_argv, web_client)
+        print("Finished %s, output saved to %s" % (lang, get_language_path(output, lang)))
+
+    try:
+        with ThreadPoolExecutor(max_workers=language_workers) as executor:
+            # a failure in any language is raised here
+            for _ in executor.map(run_language, languages):
+                pass
+    finally:
+        web_client.close()
+
+
+def run_sessions(argv, sessions, session_workers, claim_timeout):
+    """
+    Process each of the (year, month) sessions on its own, session_workers of
+    them at a time in separate processes, saving each to the aggregate store
+    as it finishes. A session claimed by another process sharing the cache
+    directory, possibly on another machine, is waited for and taken over if
+    its claim is abandoned.
+    """
+    split_threads(session_workers)
+    print("Processing %s session(s), %s at a time" % (len(sessions), session_workers))
+    with ProcessPoolExecutor(max_workers=session_workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        while len(sessions) > 0:
+            # a failure in any session is raised here
+            done = list(executor.map(checkpoint_session, itertools.repeat(argv), [year for year, month in sessions],
+                                     [month for year, month in sessions]))
+            sessions = [session for session, finished in zip(sessions, done) if not finished]
+            if len(sessions) > 0:
+                print("Waiting for %s session(s) processed elsewhere" % len(sessions))
+                time.sleep(min(claim_timeout, CLAIM_POLL_SECONDS))
+
+
+def checkpoint_session(argv, year, month):
+    # the options given last win so these replace the years and months of the whole run
+    return run(argv + ["-y", year, "-m", month], None, True)
+
+
+def get_groups(group_by, word_list, word_features):
+    """
+    Return the counts for the rows of the output, keyed by lowercase word, by
+    lemma or by (lemma, upos), along with the index holding the lowercase
+    forms behind each key when the words are grouped.
+    """
+    if group_by == "lemma":
+        index = word_features.get_lemmas()
+    elif group_by == "lemmapos":
+        index = word_features.get_lemma_pos()
+    else:
+        return word_list, None
+    return {key: sum(forms.values()) for key, forms in index.items()}, index
+
+
 def print_output(output, word_list, word_features,
                  hide_count, show_transliteration, show_lemma,
                  show_translation, show_pos, show_sentence,
-                 max_translation, min_translation):
-    translator = None
-    if show_translation:
-        translator = Translator()
-    show_translation = show_translation and translator is not None
-
-    header = "WORD"
-    if not hide_count:
-        header = "WORD COUNT\t%s" % header
-    if show_transliteration:
-        header = "%s\tTRANSLITERATION" % header
-    if show_lemma:
-        header = "%s\tLEMMA" % header
-    if show_translation:
-        header = "%s\tTRANSLATION" % header
-    if show_pos:
-        # header = "%s\tPOS\tUPOS\tXPOS\tFEATURES" % header
-        header = "%s\t\"Part of Speech\"" % header
-    if show_sentence:
-        header = "%s\tSENTENCE" % header
-    header = "%s\n" % header
-    f = None
+                 max_translation, min_translation, output_format, limit, translations,
+                 group_by="word", session_counts=None, iso_one=None, sentence_policy=DEFAULT_SENTENCE_POLICY):
+    columns, rows = get_output_rows(word_list, word_features, hide_count, show_transliteration, show_lemma,
+                                    show_translation, show_pos, show_sentence, max_translation, min_translation,
+                                    limit, translations, group_by, session_counts, iso_one, sentence_policy,
+                                    output is not None)
     if output is not None:
-        f = open(output, mode="w", encoding="utf-8")
-        f.write(header)
+        f = open_output(output, output_format)
+        write_rows(f, output_format, columns, rows)
+        f.close()
     else:
-        print(header)
+        write_rows(sys.stdout, output_format, columns, rows)
+        sys.stdout.flush()
 
-    word_list = {k: v for k, v in sorted(word_list.items(), key=lambda item: item[1], reverse=True)}
-    for word in tqdm(word_list, unit=" words", disable=True if output is None else False):
-        output_line = "%s\t%s" % (word_list[word], word)
 
-        features = word_features[word]
+def get_output_rows(word_list, word_features, hide_count, show_transliteration, show_lemma, show_translation,
+                    show_pos, show_sentence, max_translation, min_translation, limit, translations,
+                    group_by="word", session_counts=None, iso_one=None, sentence_policy=DEFAULT_SENTENCE_POLICY,
+                    progress=False):
+    """
+    Return the columns of the output and a generator of its rows, the words
+    with the highest counts first. progress shows a progress bar as the rows
+    are written.
+    """
+    show_translation = show_translation and translations is not None
+    from tqdm import tqdm
 
-        if show_transliteration:
-            output_line = "%s\t%s" % (output_line, features['transliteration'] if features['transliteration'] is not None else "")
+    sessions = list(session_counts) if session_counts else []
+    columns = get_columns(hide_count, show_transliteration, show_lemma, show_translation, show_pos, show_sentence,
+                          group_by, sessions)
+    counts, index = get_groups(group_by, word_list, word_features)
 
-        if show_lemma:
-            output_line = "%s\t%s" % (output_line, features['lemma'] if features['lemma'] is not None else "")
+    # sort once, or only keep the top words when there is a limit
+    if limit is not None:
+        words = heapq.nlargest(limit, counts.items(), key=lambda item: item[1])
+    else:
+        words = sorted(counts.items(), key=lambda item: item[1], reverse=True)
 
-        if show_translation and max_translation >= word_list[word] >= min_translation > 0:
-            translation = translator.translate(word, dest="en").text
-            output_line = "%s\t%s" % (output_line, translation if translation is not None else "")
+    def get_label(key):
+        return key[0] if group_by == "lemmapos" else key
 
-        if show_pos:
-            # output_line = "%s\t%s\t%s\t%s\t%s" % (output_line, features['pos'], features['upos'], features['xpos'], features['feats'])
-            output_line = "%s\t%s" % (output_line, features['pos'])
+    # translate every word in the range up front so the requests can be batched
+    translated = {}
+    if show_translation:
+        translated = translations.translate(list(dict.fromkeys(get_label(word) for word, count in words
+                                                               if max_translation >= count >= min_translation > 0)))
+
+    def get_rows():
+        for word, count in tqdm(words, unit=" words", disable=not progress):
+            label = get_label(word)
+            forms = None
+            if index is not None:
+                # the most frequent form stands for the group
+                forms = sorted(index[word].items(), key=lambda item: item[1], reverse=True)
+                features = word_features[forms[0][0]]
+            else:
+                features = word_features[word]
+            row = []
+            if not hide_count:
+                row.append(count)
+            row.append(label)
+
+            if forms is not None:
+                row.append(", ".join(form for form, form_count in forms))
+
+            if show_transliteration:
+                if forms is not None:
+                    row.append(get_transliteration(label, iso_one, show_transliteration))
+                else:
+                    row.append(features.transliteration if features.transliteration is not None else "")
+
+            if show_lemma:
+                if forms is not None:
+                    row.append(label)
+                else:
+                    row.append(features.lemma if features.lemma is not None else "")
 
-        if show_sentence:
-            random_int = random.randint(1, len(features['sentences'])) - 1
-            output_line = "%s\t\"%s\"" % (output_line, features['sentences'][random_int])
+            if show_translation:
+                translation = translated.get(label)
+                row.append(translation if translation is not None else "")
 
-        if output_line is not None:
-            if output is not None:
-                f.write("%s%s" % (output_line, "\n"))
-            else:
-                if output_line is not None:
-                    print(output_line)
+            if show_pos or group_by == "lemmapos":
+                # row.extend([features.pos, features.upos, features.xpos, features.feats])
+                row.append(word[1] if group_by == "lemmapos" else features.pos)
+
+            if show_sentence:
+                row.append(word_features.get_example(features, sentence_policy))
+
+            if group_by == "session":
+                row.extend(session_counts[session].get(word, 0) for session in sessions)
+            yield row
+
+    return columns, get_rows()
 
 
 def get_cache_filename(lang, year, month):
@@ -464,125 +1367,110 @@ def check_cache_exists(cache, filename):
     return os.path.exists(os.path.join(cache, filename))
 
 
-def process_session_cache(verbose, pos_support, nlp, language_data,
-                          iso_one, show_lemma, show_transliteration,
-                          cache_directory, cache_filename,
-                          word_list, word_features):
-    cache_file_path = os.path.join(cache_directory, cache_filename)
-    if verbose:
-        print("Process file %s" % cache_file_path)
+def is_session_stored(aggregate_store, aggregate_key, frequency_index, lang, year, month):
+    # a session is only merged from its stored counts once it is in the frequency index as well,
+    # otherwise it is processed again so --frequencyIndex has every session
+    if aggregate_store is None or not aggregate_store.has_session(lang, year, month, aggregate_key):
+        return False
+    return frequency_index is None or frequency_index.has_session(lang, year, month)
 
-    f = open(cache_file_path, "r")
-    session_json = json.load(f)
-    f.close()
 
-    for talk in tqdm(session_json["talks"], unit=" talks"):
-        if verbose:
-            print("PROCESSING: %s " % talk["url"])
-
-        if verbose:
-            print("%s\n%s\n%s\n%s" % (talk["title"], talk["speaker"], talk["role"], talk["summary"]))
+def check_session_cached(cache_directory, session_store, lang, year, month):
+    if session_store is not None:
+        return session_store.has_session(lang, year, month)
+    return cache_directory is not None and check_cache_exists(cache_directory, get_cache_filename(lang, year, month))
 
-        # iterate over all the paragraphs looking for p# or title# which are the text of the talk
-        for talk_para in talk["paragraphs"]:
-            paragraph = talk_para["paragraph"]
-            if verbose:
-                print(paragraph)
 
-            if pos_support:
-                word_list, word_features = process_paragraph_stanza(nlp, paragraph, word_list, word_features, iso_one, show_transliteration)
+def iter_sessions(sessions, lang, cache_directory, cache_format, site_url, web_client, html_parser, profiler=None):
+    """
+    The source of the pipeline. Yields each session framed by SESSION_START and
+    SESSION_END markers holding (year, month, source, base_url). A cached
+    session yields ("talk", talk) for each of its talks as they are read, a
+    session from the web yields ("page", talk_url, future) as web_client starts
+    the downloads, and a session with stored counts yields nothing in between.
+    """
+    # the pipeline runs this in its own thread so it opens its own connections to the stores
+    session_store = None
+    if cache_directory is not None and cache_format == "sqlite":
+        session_store = SessionStore(get_session_store_path(cache_directory))
+    try:
+        for year, month, source in sessions:
+            if source == "aggregate":
+                yield SESSION_START, (year, month, source, None)
+            elif source == "cache":
+                yield SESSION_START, (year, month, source, None)
+                if session_store is not None:
+                    # the store hands back one talk at a time rather than the whole session
+                    talks = session_store.iter_talks(lang, year, month)
+                else:
+                    with open(os.path.join(cache_directory, get_cache_filename(lang, year, month)), "r") as f:
+                        talks = json.load(f)["talks"]
+                for talk in talks:
+                    yield "talk", talk
             else:
-                word_list, word_features = process_paragraph_nltk(language_data, paragraph, word_list, word_features, iso_one, show_lemma, show_transliteration)
-
-    return word_list, word_features
+                from ConferenceScraperApp import fetch
+                yield SESSION_START, (year, month, source, fetch.get_session_url(site_url, year, month, lang))
+                yield from web_client.iter_talk_pages(site_url, lang, year, month, html_parser, profiler)
+            yield SESSION_END, (year, month, source, None)
+    finally:
+        if session_store is not None:
+            session_store.close()
 
 
-def process_session_web(verbose, site_url, pos_support, nlp, language_data,
-                        iso_one, show_lemma, show_transliteration, year, month,
-                        lang_url, word_list, word_features, cache_directory):
-    base_url = "%s/study/general-conference/%s/%s?lang=%s" % (site_url, year, month, lang_url)
-    if verbose:
-        print("Begin scraping %s/%s in %s ( %s )" % (month, year, lang_url, base_url))
+def extract_page(get_talk, profiler, item):
+    """
+    The extract stage. Waits for a talk page to finish downloading and pulls
+    the talk out of it. Talks without a speaker are dropped and talks read
+    from the cache are handed on as they are.
+    """
+    if item[0] != "page":
+        return item
+    kind, talk_url, page = item
+    content = page.result()
+    # only the parsing is timed, the wait for the download is part of the fetch
+    with measure(profiler, "extract", talk=talk_url) as measured:
+        measured["bytes"] = len(content)
+        talk = get_talk(content)
+    if talk["speaker"] is None or talk["speaker"] == "":
+        return None
+    return "talk", {
+        "url": talk_url,
+        "title": talk["title"],
+        "speaker": talk["speaker"],
+        "role": talk["role"],
+        "summary": talk["summary"],
+        "paragraphs": talk["paragraphs"]
+    }
 
-    # load the URL based on the input
-    base_page = requests.get(base_url)
 
-    # load the page HTML into beautiful soup
-    base_soup = BeautifulSoup(base_page.content, "html.parser")
+def annotate_talk(pos_support, nlp, language_data, iso_one, show_lemma, batch_size, pool, annotation_cache, profiler,
+                  item):
+    """
+    The annotate stage. Without a pool the paragraphs of the talk are annotated
+    here. With a pool the talk is handed to a worker and the result is waited
+    on by the aggregate stage, so several talks are processed at once.
+    """
+    kind, talk = item
+    paragraphs = [talk_para["paragraph"] for talk_para in talk["paragraphs"]]
+    if pool is not None:
+        return kind, talk, pool.apply_async(process_talk_worker, (paragraphs, talk["url"]))
+    with measure(profiler, "annotate", talk=talk["url"]) as measured:
+        measured["bytes"] = get_text_size(talk)
+        annotations = annotate_paragraphs(pos_support, nlp, language_data, paragraphs, show_lemma, batch_size,
+                                          annotation_cache, iso_one)
+    return kind, talk, annotations
 
-    # get a list of all the talks
-    talks = base_soup.findAll("a", {"class": lambda l: l and l.startswith('listTile')})
 
-    session_json = None
-    if cache_directory is not None:
-        session_json = {
-            "language": lang_url,
-            "year": year,
-            "month": month,
-            "base_url": base_url,
-            "talks": []
-        }
-    # iterate over each talk URL
-    for talk_link in tqdm(talks, unit=" talks"):
-        talk_url = "%s?lang=%s" % (talk_link["href"], lang_url)
-        if verbose:
-            print("PROCESSING: %s " % talk_url)
-        # load the talk page and convert to a BeautifulSoup object
-        talk_page = requests.get("%s%s" % (site_url, talk_url))
-        talk_soup = BeautifulSoup(talk_page.content, "html.parser")
-        # Get the talk metadata
-        title = talk_soup.find("title").text
-        speaker = \
-            talk_soup.find("p", class_="author-name").text if talk_soup.find("p", class_="author-name") else ""
-        speaker = speaker.replace("\xa0", " ")
-        role = \
-            talk_soup.find("p", class_="author-role").text if talk_soup.find("p", class_="author-role") else ""
-        summary = talk_soup.find("p", class_="kicker").text if talk_soup.find("p", class_="kicker") \
-            else ""
-
-        if speaker is None or speaker == "":
-            continue
+def get_text_size(talk):
+    return sum(len(talk_para["paragraph"].encode("utf-8")) for talk_para in talk["paragraphs"])
 
-        if verbose:
-            print("%s\n%s\n%s\n%s" % (title, speaker, role, summary))
-
-        talk_paragraphs = talk_soup.findAll("p", id=re.compile(".*"))
-
-        talk_json = None
-        if session_json is not None:
-            talk_json = {
-                "url": talk_url,
-                "title": title,
-                "speaker": speaker,
-                "role": role,
-                "summary": summary,
-                "paragraphs": []
-            }
-        # iterate over all the paragraphs looking for p# or title# which are the text of the talk
-        for talk_para in talk_paragraphs:
-            if "id" in talk_para.attrs and \
-                    (re.search(r"^p\d+$", talk_para["id"]) or re.search(r"^title\d+$", talk_para["id"])):
-                paragraph = talk_para.text
-                if talk_json is not None:
-                    talk_json["paragraphs"].append({
-                        "id": talk_para.attrs["id"],
-                        "paragraph": paragraph
-                    })
-                if verbose:
-                    print(paragraph)
 
-                if pos_support:
-                    word_list, word_features = process_paragraph_stanza(nlp, paragraph, word_list, word_features, iso_one, show_transliteration)
-                else:
-                    word_list, word_features = process_paragraph_nltk(language_data, paragraph, word_list, word_features, iso_one, show_lemma, show_transliteration)
-        if session_json is not None and talk_json is not None:
-            session_json["talks"].append(talk_json)
-    if cache_directory is not None and \
-            session_json is not None and \
-            len(session_json["talks"]) > 0:
-        cache_filename = get_cache_filename(lang_url, year, month)
+def save_session_cache(cache_directory, session_store, session_json):
+    if session_store is not None:
+        session_store.save_session(session_json)
+    else:
+        cache_filename = get_cache_filename(session_json["language"], session_json["year"], session_json["month"])
         cache_full_path = os.path.join(cache_directory, cache_filename)
         f = open(cache_full_path, "w")
         json.dump(session_json, f)
         f.close()
-    return word_list, word_features
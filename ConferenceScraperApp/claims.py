@@ -0,0 +1,116 @@
+import os
+import json
+import time
+import socket
+
+CLAIM_DIRECTORY = "claims"
+# a claim that hasn't been refreshed for this many seconds belongs to a process that stopped
+DEFAULT_CLAIM_TIMEOUT = 600
+# how often a session claimed elsewhere is checked on
+CLAIM_POLL_SECONDS = 30
+
+
+def get_claim_path(cache_directory, lang, year, month, settings_key):
+    return os.path.join(cache_directory, CLAIM_DIRECTORY, "%s_%s_%s_%s.claim" % (lang, year, month, settings_key))
+
+
+class SessionClaim:
+    """
+    A file in the cache directory marking a session as being processed, so
+    the processes and machines sharing the directory don't process the same
+    session twice. The file's modification time is refreshed while the
+    session is processed.
+    """
+
+    def __init__(self, path, timeout=DEFAULT_CLAIM_TIMEOUT):
+        self.path = path
+        self.timeout = timeout
+        self.refreshed = time.time()
+
+    def refresh(self):
+        # refreshed often enough that the claim never looks abandoned, without touching the file on every talk
+        now = time.time()
+        if now - self.refreshed < self.timeout / 10:
+            return
+        self.refreshed = now
+        try:
+            os.utime(self.path)
+        except FileNotFoundError:
+            pass
+
+    def release(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def acquire_claim(path, timeout=DEFAULT_CLAIM_TIMEOUT):
+    """
+    Claim the session at path and return the SessionClaim, or None when
+    another process holds a claim on it that is still fresh.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # a second attempt for when an abandoned claim was removed
+    for _ in range(2):
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            if not remove_abandoned_claim(path, timeout):
+                return None
+            continue
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"host": socket.gethostname(), "pid": os.getpid(), "claimed": time.time()}, f)
+        return SessionClaim(path, timeout)
+    return None
+
+
+def remove_abandoned_claim(path, timeout):
+    try:
+        if time.time() - os.path.getmtime(path) < timeout and not is_owner_stopped(path):
+            return False
+        # renaming is atomic so only one of the processes taking over the claim removes it
+        abandoned = "%s.%s-%s" % (path, socket.gethostname(), os.getpid())
+        os.rename(path, abandoned)
+        os.remove(abandoned)
+    except FileNotFoundError:
+        # it was released or taken over in the meantime
+        pass
+    return True
+
+
+def is_owner_stopped(path):
+    # a claim left by a process of this machine that isn't running anymore is abandoned without waiting for it
+    if os.name != "posix":
+        return False
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            claim = json.load(f)
+        if claim["host"] != socket.gethostname():
+            return False
+        os.kill(claim["pid"], 0)
+    except ProcessLookupError:
+        return True
+    except (FileNotFoundError, PermissionError, ValueError, KeyError, TypeError):
+        pass
+    return False
+
+
+def is_own_claim(path):
+    # a claim held by this process
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            claim = json.load(f)
+        return claim["host"] == socket.gethostname() and claim["pid"] == os.getpid()
+    except (FileNotFoundError, ValueError, KeyError):
+        return False
+
+
+def get_claim_owner(path):
+    # for the messages about sessions processed elsewhere
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            claim = json.load(f)
+        return "%s (pid %s)" % (claim["host"], claim["pid"])
+    except (FileNotFoundError, ValueError, KeyError):
+        return "another process"
@@ -0,0 +1,225 @@
+import re
+from html.entities import html5
+from html.parser import HTMLParser
+from html import unescape
+
+HTML_PARSERS = ("fast", "bs4")
+
+# the paragraphs that hold the text of a talk have ids like p12 or title3
+PARAGRAPH_ID_PATTERN = re.compile(r"^p\d+$|^title\d+$")
+# the metadata paragraphs of a talk identified by their class
+METADATA_CLASSES = {
+    "author-name": "speaker",
+    "author-role": "role",
+    "kicker": "summary"
+}
+# elements that never have content or an end tag
+VOID_ELEMENTS = frozenset(["area", "base", "basefont", "bgsound", "br", "col", "command", "embed", "frame", "hr",
+                           "image", "img", "input", "isindex", "keygen", "link", "menuitem", "meta", "nextid",
+                           "param", "source", "spacer", "track", "wbr"])
+# elements whose text beautiful soup leaves out of .text
+HIDDEN_TEXT_ELEMENTS = frozenset(["script", "style", "template", "rt", "rp"])
+NUMERIC_REFERENCE_PATTERN = re.compile(r"^([0-9]+)(.*)$")
+HEX_REFERENCE_PATTERN = re.compile(r"^([0-9a-f]+)(.*)$", re.IGNORECASE)
+
+
+def decode_page(content):
+    if isinstance(content, str):
+        return content
+    try:
+        return content.decode("utf-8")
+    except UnicodeDecodeError:
+        # let beautiful soup work out the encoding of pages that aren't utf-8
+        from bs4 import UnicodeDammit
+        return UnicodeDammit(content, is_html=True).unicode_markup
+
+
+class TalkParser(HTMLParser):
+    """
+    Collects the title, speaker, role, summary and the p#/title# paragraphs of
+    a talk page in a single pass over the markup without building a tree.
+    Text is gathered the same way beautiful soup's .text would for the first
+    matching element of each field and every matching paragraph, including
+    the text of nested elements.
+    """
+
+    def __init__(self):
+        # character references are resolved by the handlers below the same way beautiful soup does
+        super().__init__(convert_charrefs=False)
+        # the open elements as (tag, text parts or None when the element isn't collected)
+        self.stack = []
+        # the text parts of every collected element that is currently open
+        self.collecting = []
+        # number of open elements whose text is hidden from .text
+        self.hidden = 0
+        self.fields = {}
+        self.paragraphs = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in VOID_ELEMENTS:
+            return
+        parts = None
+        if tag == "title" and "title" not in self.fields:
+            parts = []
+            self.fields["title"] = parts
+        elif tag == "p" and len(attrs) > 0:
+            attributes = dict(attrs)
+            classes = attributes.get("class")
+            if classes:
+                class_names = classes.split()
+                for class_name, field in METADATA_CLASSES.items():
+                    if field not in self.fields and (class_name in class_names or classes == class_name):
+                        if parts is None:
+                            parts = []
+                        self.fields[field] = parts
+            paragraph_id = attributes.get("id")
+            if paragraph_id is not None and PARAGRAPH_ID_PATTERN.match(paragraph_id):
+                if parts is None:
+                    parts = []
+                self.paragraphs.append((paragraph_id, parts))
+        self.stack.append((tag, parts))
+        if parts is not None:
+            self.collecting.append(parts)
+        if tag in HIDDEN_TEXT_ELEMENTS:
+            self.hidden += 1
+
+    def handle_endtag(self, tag):
+        if tag in VOID_ELEMENTS:
+            return
+        # an end tag closes the most recent open element with that name and everything opened inside it
+        for index in range(len(self.stack) - 1, -1, -1):
+            if self.stack[index][0] == tag:
+                self.close_elements(index)
+                return
+
+    def close_elements(self, index):
+        while len(self.stack) > index:
+            tag, parts = self.stack.pop()
+            if parts is not None:
+                self.collecting.pop()
+            if tag in HIDDEN_TEXT_ELEMENTS:
+                self.hidden -= 1
+
+    def handle_data(self, data):
+        if self.hidden == 0:
+            for parts in self.collecting:
+                parts.append(data)
+
+    def handle_entityref(self, name):
+        character = html5.get("%s;" % name)
+        self.handle_data(character if character is not None else "&%s" % name)
+
+    def handle_charref(self, name):
+        base = 10
+        pattern = NUMERIC_REFERENCE_PATTERN
+        if name.startswith("x") or name.startswith("X"):
+            name = name[1:]
+            base = 16
+            pattern = HEX_REFERENCE_PATTERN
+        extra_data = ""
+        try:
+            number = int(name, base)
+        except ValueError:
+            # a reference without its semicolon runs into the text that follows it
+            match = pattern.match(name)
+            if match is None:
+                self.handle_data(name)
+                return
+            number = int(match.group(1), base)
+            extra_data = match.group(2)
+        self.handle_data(unescape("&#%d;" % number))
+        if extra_data:
+            self.handle_data(extra_data)
+
+    def unknown_decl(self, data):
+        if data.upper().startswith("CDATA["):
+            self.handle_data(data[len("CDATA["):])
+
+    def close(self):
+        super().close()
+        self.close_elements(0)
+
+
+def extract_talk(content):
+    """
+    Pull the metadata and the text paragraphs out of a talk page. Returns the
+    same dictionary as extract_talk_bs4 but parses the page in one pass.
+    """
+    parser = TalkParser()
+    parser.feed(decode_page(content))
+    parser.close()
+    fields = {field: "".join(parts) for field, parts in parser.fields.items()}
+    return {
+        "title": fields.get("title", ""),
+        "speaker": fields.get("speaker", "").replace("\xa0", " "),
+        "role": fields.get("role", ""),
+        "summary": fields.get("summary", ""),
+        "paragraphs": [{"id": paragraph_id, "paragraph": "".join(parts)} for paragraph_id, parts in parser.paragraphs]
+    }
+
+
+def extract_talk_bs4(content):
+    """
+    The original beautiful soup extraction, kept as the reference the fast
+    parser is compared against.
+    """
+    from bs4 import BeautifulSoup
+    talk_soup = BeautifulSoup(content, "html.parser")
+    # Get the talk metadata
+    title = talk_soup.find("title").text
+    speaker = \
+        talk_soup.find("p", class_="author-name").text if talk_soup.find("p", class_="author-name") else ""
+    speaker = speaker.replace("\xa0", " ")
+    role = \
+        talk_soup.find("p", class_="author-role").text if talk_soup.find("p", class_="author-role") else ""
+    summary = talk_soup.find("p", class_="kicker").text if talk_soup.find("p", class_="kicker") \
+        else ""
+
+    paragraphs = []
+    # iterate over all the paragraphs looking for p# or title# which are the text of the talk
+    for talk_para in talk_soup.findAll("p", id=re.compile(".*")):
+        if "id" in talk_para.attrs and \
+                (re.search(r"^p\d+$", talk_para["id"]) or re.search(r"^title\d+$", talk_para["id"])):
+            paragraphs.append({
+                "id": talk_para.attrs["id"],
+                "paragraph": talk_para.text
+            })
+    return {
+        "title": title,
+        "speaker": speaker,
+        "role": role,
+        "summary": summary,
+        "paragraphs": paragraphs
+    }
+
+
+class TalkLinkParser(HTMLParser):
+    # collects the href of every link with a class starting with listTile in the session index page
+    def __init__(self):
+        # tokenise the page exactly like beautiful soup's parser so the same links are found
+        super().__init__(convert_charrefs=False)
+        self.links = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "a":
+            attributes = dict(attrs)
+            classes = attributes.get("class")
+            if classes and any(class_name.startswith("listTile") for class_name in classes.split()) and \
+                    attributes.get("href") is not None:
+                self.links.append(attributes["href"])
+
+
+def extract_talk_urls(content, lang_url):
+    parser = TalkLinkParser()
+    parser.feed(decode_page(content))
+    parser.close()
+    return ["%s?lang=%s" % (href, lang_url) for href in parser.links]
+
+
+def extract_talk_urls_bs4(content, lang_url):
+    from bs4 import BeautifulSoup
+    # load the page HTML into beautiful soup
+    base_soup = BeautifulSoup(content, "html.parser")
+    # get a list of all the talks
+    talks = base_soup.findAll("a", {"class": lambda l: l and l.startswith('listTile')})
+    return ["%s?lang=%s" % (talk_link["href"], lang_url) for talk_link in talks]
@@ -0,0 +1,180 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+# Web requests
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from ConferenceScraperApp.extract import extract_talk_urls, extract_talk_urls_bs4
+from ConferenceScraperApp.frequency_index import get_session_key
+from ConferenceScraperApp.profiling import measure
+
+# seconds to wait for a single response before giving up on the request
+REQUEST_TIMEOUT = 30
+# responses that are worth retrying after a short wait
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class HostRateLimiter:
+    """
+    Spaces out requests sent to the same host by at least min_interval seconds.
+    The limiter is shared by all the fetch threads so the combined request rate
+    stays bounded no matter how many workers are running.
+    """
+
+    def __init__(self, min_interval):
+        self.min_interval = min_interval
+        self.lock = threading.Lock()
+        self.next_slot = {}
+
+    def wait(self, url):
+        if self.min_interval <= 0:
+            return
+        host = urlsplit(url).netloc
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + self.min_interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def create_http_session(workers, retries, backoff=0.5):
+    """
+    Build a requests session with a connection pool large enough for every
+    fetch worker and retries with exponential backoff for transient errors.
+    """
+    retry = Retry(total=retries, backoff_factor=backoff, status_forcelist=RETRY_STATUSES,
+                  allowed_methods=("GET",), raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers, max_retries=retry)
+    http_session = requests.Session()
+    http_session.mount("http://", adapter)
+    http_session.mount("https://", adapter)
+    return http_session
+
+
+def get_session_url(site_url, year, month, lang_url):
+    return "%s/study/general-conference/%s/%s?lang=%s" % (site_url, year, month, lang_url)
+
+
+def fetch_page(http_session, rate_limiter, url, page_cache=None, profiler=None, session=None, talk=None):
+    """
+    Download a page. With a page_cache a page fetched within its max age is
+    returned without a request, and an older one is revalidated with a
+    conditional request so an unchanged page isn't downloaded again. With a
+    profiler the time and size of the page are recorded for session and talk.
+    """
+    with measure(profiler, "fetch", session, talk) as measured:
+        content = get_page(http_session, rate_limiter, url, page_cache)
+        measured["bytes"] = len(content)
+    return content
+
+
+def get_page(http_session, rate_limiter, url, page_cache):
+    if page_cache is None:
+        rate_limiter.wait(url)
+        response = http_session.get(url, timeout=REQUEST_TIMEOUT)
+        check_response(response, url)
+        return response.content
+
+    headers = {}
+    cached = page_cache.get(url)
+    if cached is not None:
+        content, etag, last_modified, fresh = cached
+        if fresh:
+            page_cache.count("fresh")
+            return content
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+
+    rate_limiter.wait(url)
+    response = http_session.get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+    if response.status_code == 304 and cached is not None:
+        page_cache.touch(url)
+        page_cache.count("revalidated")
+        return cached[0]
+    check_response(response, url)
+    page_cache.put(url, response.content, response.headers.get("ETag"), response.headers.get("Last-Modified"))
+    page_cache.count("downloaded")
+    return response.content
+
+
+def check_response(response, url):
+    # a page that is missing or still failing after the retries fails the session, so a session with talks
+    # left out isn't cached or stored as done
+    if response.status_code != 200:
+        raise requests.HTTPError("%s returned %s" % (url, response.status_code), response=response)
+
+
+def iter_talk_pages(executor, http_session, rate_limiter, site_url, lang_url, year, month, verbose=False,
+                    html_parser="fast", page_cache=None, profiler=None):
+    """
+    Download the index page of a session and yield ("page", talk_url, future)
+    for each talk in the order they appear on it. Each talk page is handed to
+    executor as soon as its url is known, so the downloads run ahead of
+    whoever is waiting on the futures for as long as they keep taking them.
+    """
+    get_talk_urls = extract_talk_urls_bs4 if html_parser == "bs4" else extract_talk_urls
+    base_url = get_session_url(site_url, year, month, lang_url)
+    if verbose:
+        print("Begin scraping %s" % base_url)
+    session = get_session_key(year, month)
+    try:
+        base_content = fetch_page(http_session, rate_limiter, base_url, page_cache, profiler, session)
+    except requests.HTTPError as err:
+        # a session that hasn't happened yet has no index page and no talks
+        if err.response.status_code != 404:
+            raise
+        if verbose:
+            print("%s wasn't found" % base_url)
+        return
+    for talk_url in get_talk_urls(base_content, lang_url):
+        yield "page", talk_url, executor.submit(fetch_page, http_session, rate_limiter, "%s%s" % (site_url, talk_url),
+                                                page_cache, profiler, session, talk_url)
+
+
+class WebClient:
+    """
+    The connection pool, rate limiter, download threads and page cache used
+    for every session downloaded in a run. When several languages are
+    processed at once they share a single client, so the requests of all of
+    them go through one pool and stay within one rate limit. Nothing is set up
+    until the first page is needed.
+    """
+
+    def __init__(self, fetch_workers, rate_limit, retries, page_cache=None, verbose=False):
+        self.fetch_workers = fetch_workers
+        self.rate_limit = rate_limit
+        self.retries = retries
+        self.page_cache = page_cache
+        self.verbose = verbose
+        self.lock = threading.Lock()
+        self.http_session = None
+        self.rate_limiter = None
+        self.executor = None
+
+    def start(self):
+        with self.lock:
+            if self.http_session is None:
+                self.rate_limiter = HostRateLimiter(self.rate_limit)
+                self.executor = ThreadPoolExecutor(max_workers=self.fetch_workers)
+                self.http_session = create_http_session(self.fetch_workers, self.retries)
+
+    def iter_talk_pages(self, site_url, lang_url, year, month, html_parser="fast", profiler=None):
+        self.start()
+        yield from iter_talk_pages(self.executor, self.http_session, self.rate_limiter, site_url, lang_url, year,
+                                   month, self.verbose, html_parser, self.page_cache, profiler)
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+        if self.http_session is not None:
+            self.http_session.close()
+        if self.page_cache is not None:
+            if self.verbose:
+                print("Pages reused: %(fresh)s, revalidated: %(revalidated)s, downloaded: %(downloaded)s" %
+                      self.page_cache.counts)
+            self.page_cache.close()
@@ -0,0 +1,20 @@
+import json
+import os
+import tempfile
+
+
+def save_json(path, data):
+    """
+    Write data to path as json. It is written to a temporary file in the same
+    folder first, so an interrupted save doesn't lose the previous file and
+    two processes saving at once each replace it with a complete file.
+    """
+    fd, temp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp",
+                                     dir=os.path.dirname(path) or ".")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
@@ -0,0 +1,162 @@
+import os
+import sqlite3
+
+FREQUENCY_INDEX_FILENAME = "frequency.sqlite3"
+
+
+def get_frequency_index_path(cache_directory):
+    return os.path.join(cache_directory, FREQUENCY_INDEX_FILENAME)
+
+
+def get_session_key(year, month):
+    # sessions compare in time order as text
+    return "%s-%s" % (year, month)
+
+
+class FrequencyIndex:
+    """
+    The word counts of every talk along with its session, speaker and role, so
+    questions about a slice of the talks are answered with a query instead of
+    processing the text again. Words are stored once and referred to by id.
+    Indexing a session again replaces the counts it had before.
+
+    Besides the counts of each talk the index keeps the counts of each session
+    and the total and first session of each word, so a question only reads
+    the talks of the speakers it names.
+
+    The talks of a session are kept in memory and written when it ends, so
+    the index is only locked briefly by each of the processes sharing it.
+    """
+
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path, timeout=60)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS talks ("
+                                "id INTEGER PRIMARY KEY, lang TEXT, session TEXT, position INTEGER, url TEXT, "
+                                "title TEXT, speaker TEXT, role TEXT)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS talks_session ON talks (lang, session)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS talks_speaker ON talks (lang, speaker)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS words (id INTEGER PRIMARY KEY, word TEXT UNIQUE)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS counts ("
+                                "talk_id INTEGER, word_id INTEGER, count INTEGER, "
+                                "PRIMARY KEY (talk_id, word_id)) WITHOUT ROWID")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS session_counts ("
+                                "lang TEXT, session TEXT, word_id INTEGER, count INTEGER, "
+                                "PRIMARY KEY (lang, session, word_id)) WITHOUT ROWID")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS word_totals ("
+                                "lang TEXT, word_id INTEGER, count INTEGER, first_session TEXT, "
+                                "PRIMARY KEY (lang, word_id)) WITHOUT ROWID")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS word_totals_count ON word_totals (lang, count)")
+        self.connection.commit()
+        self.word_ids = {}
+        self.lang = None
+        self.session = None
+        self.talks = []
+        self.session_counts = {}
+
+    def has_session(self, lang, year, month):
+        row = self.connection.execute("SELECT 1 FROM talks WHERE lang = ? AND session = ? LIMIT 1",
+                                      (lang, get_session_key(year, month))).fetchone()
+        return row is not None
+
+    def begin_session(self, lang, year, month):
+        self.lang = lang
+        self.session = get_session_key(year, month)
+        self.talks = []
+        self.session_counts = {}
+
+    def add_talk(self, talk, counts):
+        self.talks.append(((talk["url"], talk["title"], talk["speaker"], talk["role"]), dict(counts)))
+        for word, count in counts.items():
+            self.session_counts[word] = self.session_counts.get(word, 0) + count
+
+    def end_session(self):
+        self.connection.execute("DELETE FROM counts WHERE talk_id IN "
+                                "(SELECT id FROM talks WHERE lang = ? AND session = ?)", (self.lang, self.session))
+        self.connection.execute("DELETE FROM talks WHERE lang = ? AND session = ?", (self.lang, self.session))
+        self.connection.execute("DELETE FROM session_counts WHERE lang = ? AND session = ?", (self.lang, self.session))
+        for position, (fields, counts) in enumerate(self.talks):
+            cursor = self.connection.execute("INSERT INTO talks (lang, session, position, url, title, speaker, role) "
+                                             "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                             (self.lang, self.session, position) + fields)
+            self.connection.executemany("INSERT INTO counts (talk_id, word_id, count) VALUES (?, ?, ?)",
+                                        [(cursor.lastrowid, self.get_word_id(word), count)
+                                         for word, count in counts.items()])
+        self.connection.executemany("INSERT INTO session_counts (lang, session, word_id, count) VALUES (?, ?, ?, ?)",
+                                    [(self.lang, self.session, self.get_word_id(word), count)
+                                     for word, count in self.session_counts.items()])
+        # the totals are rebuilt from the sessions so indexing a session again doesn't count it twice
+        self.connection.execute("DELETE FROM word_totals WHERE lang = ?", (self.lang,))
+        self.connection.execute("INSERT INTO word_totals (lang, word_id, count, first_session) "
+                                "SELECT lang, word_id, SUM(count), MIN(session) FROM session_counts "
+                                "WHERE lang = ? GROUP BY word_id", (self.lang,))
+        self.connection.commit()
+        self.talks = []
+        self.session_counts = {}
+
+    def get_word_id(self, word):
+        word_id = self.word_ids.get(word)
+        if word_id is None:
+            self.connection.execute("INSERT OR IGNORE INTO words (word) VALUES (?)", (word,))
+            word_id = self.connection.execute("SELECT id FROM words WHERE word = ?", (word,)).fetchone()[0]
+            self.word_ids[word] = word_id
+        return word_id
+
+    def top_words(self, lang, sessions=None, speakers=None, exclude_speakers=None, new_since=None, limit=None):
+        """
+        Return (word, count) pairs with the highest counts first, over the talks
+        of the given sessions (every session when None), only by speakers and
+        leaving out exclude_speakers. With new_since (a session like 2019-04)
+        only words that weren't used in any talk before that session count.
+        """
+        # the talks of the named speakers, in the sessions asked for
+        talk_conditions = ["t.lang = ?"]
+        talk_parameters = [lang]
+        # the per session counts, in the sessions asked for
+        session_conditions = ["s.lang = ?"]
+        session_parameters = [lang]
+        if sessions is not None:
+            talk_conditions.append("t.session IN (%s)" % ",".join("?" * len(sessions)))
+            talk_parameters.extend(sessions)
+            session_conditions.append("s.session IN (%s)" % ",".join("?" * len(sessions)))
+            session_parameters.extend(sessions)
+        if new_since is not None:
+            talk_conditions.append("t.session >= ?")
+            talk_parameters.append(new_since)
+            session_conditions.append("s.session >= ?")
+            session_parameters.append(new_since)
+
+        if speakers:
+            talk_conditions.append("t.speaker IN (%s)" % ",".join("?" * len(speakers)))
+            talk_parameters.extend(speakers)
+            base = "SELECT c.word_id, SUM(c.count) AS count FROM counts c JOIN talks t ON t.id = c.talk_id " \
+                   "WHERE %s GROUP BY c.word_id" % " AND ".join(talk_conditions)
+            parameters = talk_parameters
+        elif sessions is None and new_since is None:
+            # every session is already added up
+            base = "SELECT s.word_id, s.count FROM word_totals s WHERE s.lang = ?"
+            parameters = [lang]
+        else:
+            base = "SELECT s.word_id, SUM(s.count) AS count FROM session_counts s WHERE %s GROUP BY s.word_id" % \
+                   " AND ".join(session_conditions)
+            parameters = session_parameters
+
+        query = "SELECT w.word, b.count%s AS total FROM (%s) b JOIN words w ON w.id = b.word_id" % \
+                (" - COALESCE(x.count, 0)" if exclude_speakers else "", base)
+        if exclude_speakers:
+            # take away what the excluded speakers said rather than adding up everyone else's talks
+            talk_conditions.append("t.speaker IN (%s)" % ",".join("?" * len(exclude_speakers)))
+            query += " LEFT JOIN (SELECT c.word_id, SUM(c.count) AS count FROM counts c " \
+                     "JOIN talks t ON t.id = c.talk_id WHERE %s GROUP BY c.word_id) x ON x.word_id = b.word_id" % \
+                     " AND ".join(talk_conditions)
+            parameters = parameters + talk_parameters + list(exclude_speakers)
+        if new_since is not None:
+            query += " JOIN word_totals f ON f.lang = ? AND f.word_id = b.word_id AND f.first_session >= ?"
+            parameters = parameters + [lang, new_since]
+        query += " WHERE total > 0 ORDER BY total DESC, w.word"
+        if limit is not None:
+            query += " LIMIT ?"
+            parameters = parameters + [limit]
+        return self.connection.execute(query, parameters).fetchall()
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,15 @@
+# Copy the json session cache files in a cache directory into the sqlite session store used by --cacheFormat=sqlite.
+# Usage: python ConferenceScraperApp/migrate_cache.py <CACHE_DIRECTORY>
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ConferenceScraperApp.session_store import SessionStore, get_session_store_path, migrate_json_cache
+if __name__ == '__main__':
+    if len(sys.argv) != 2 or not os.path.isdir(sys.argv[1]):
+        print("migrate_cache <CACHE_DIRECTORY>")
+        sys.exit(2)
+    store = SessionStore(get_session_store_path(sys.argv[1]))
+    count = migrate_json_cache(sys.argv[1], store, verbose=True)
+    store.close()
+    print("Migrated %s session(s) to %s" % (count, get_session_store_path(sys.argv[1])))
@@ -0,0 +1,86 @@
+import csv
+import json
+
+OUTPUT_FORMATS = ("tsv", "csv", "jsonl", "anki")
+# what each row of the output counts: a lowercase word, a lemma, a lemma with its part of speech or a word
+# with a column of counts for each session
+GROUP_BY = ("word", "lemma", "lemmapos", "session")
+# size of the write buffer used for output files
+OUTPUT_BUFFER_SIZE = 1 << 20
+
+
+def get_columns(hide_count, show_transliteration, show_lemma, show_translation, show_pos, show_sentence,
+                group_by="word", sessions=()):
+    """
+    Return the (key, header) pairs of the output columns in the order they are
+    written. sessions are the labels of the per session count columns.
+    """
+    columns = []
+    if not hide_count:
+        columns.append(("count", "WORD COUNT"))
+    columns.append(("word", "WORD"))
+    if group_by in ("lemma", "lemmapos"):
+        columns.append(("forms", "FORMS"))
+    if show_transliteration:
+        columns.append(("transliteration", "TRANSLITERATION"))
+    if show_lemma:
+        columns.append(("lemma", "LEMMA"))
+    if show_translation:
+        columns.append(("translation", "TRANSLATION"))
+    # grouping by lemma and part of speech always shows the part of speech that sets the rows apart
+    if show_pos or group_by == "lemmapos":
+        columns.append(("pos", "Part of Speech"))
+    if show_sentence:
+        columns.append(("sentence", "SENTENCE"))
+    if group_by == "session":
+        columns.extend((session, session) for session in sessions)
+    return columns
+
+
+def open_output(output, output_format):
+    # spreadsheet programs need the byte order mark to detect utf-8 in a csv file
+    encoding = "utf-8-sig" if output_format in ("csv", "anki") else "utf-8"
+    newline = "" if output_format in ("csv", "anki") else None
+    return open(output, mode="w", encoding=encoding, newline=newline, buffering=OUTPUT_BUFFER_SIZE)
+
+
+def write_rows(f, output_format, columns, rows):
+    """
+    Write the header and rows to f in one of the OUTPUT_FORMATS. rows is an
+    iterable of lists holding a value for each column, and is consumed lazily
+    so the whole output never has to be held in memory.
+    """
+    if output_format == "tsv":
+        write_tsv(f, columns, rows)
+    elif output_format == "csv":
+        writer = csv.writer(f)
+        writer.writerow([header for key, header in columns])
+        writer.writerows(rows)
+    elif output_format == "jsonl":
+        keys = [key for key, header in columns]
+        f.writelines("%s\n" % json.dumps(dict(zip(keys, row)), ensure_ascii=False) for row in rows)
+    elif output_format == "anki":
+        write_anki(f, columns, rows)
+
+
+def write_tsv(f, columns, rows):
+    # the tab separated layout quotes the part of speech header and the sentences
+    quoted = [key == "sentence" for key, header in columns]
+    f.write("%s\n" % "\t".join("\"%s\"" % header if key == "pos" else header for key, header in columns))
+    f.writelines("%s\n" % "\t".join("\"%s\"" % value if quote else str(value) for value, quote in zip(row, quoted))
+                 for row in rows)
+
+
+def write_anki(f, columns, rows):
+    """
+    Write the Anki import layout from the Output folder: the word, a column for
+    each selected field and a last column with the fields labelled and joined
+    with <br><br> for the back of the card. There is no header and no count.
+    """
+    fields = [(index, header.capitalize()) for index, (key, header) in enumerate(columns)
+              if key not in ("count", "word")]
+    word_index = [key for key, header in columns].index("word")
+    writer = csv.writer(f)
+    writer.writerows([row[word_index]] + [row[index] for index, label in fields] +
+                     ["<br><br>".join("%s: %s" % (label, row[index]) for index, label in fields)]
+                     for row in rows)
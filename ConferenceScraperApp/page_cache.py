@@ -0,0 +1,64 @@
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+PAGE_CACHE_FILENAME = "pages.sqlite3"
+# seconds a downloaded page is used as is before it is revalidated with the server
+DEFAULT_PAGE_MAX_AGE = 86400
+
+
+def get_page_cache_path(cache_directory):
+    return os.path.join(cache_directory, PAGE_CACHE_FILENAME)
+
+
+class PageCache:
+    """
+    Keeps the raw body of every page downloaded along with its ETag and
+    Last-Modified headers, keyed by url. Each page is saved as soon as it is
+    downloaded so a run that fails part way through picks up from the pages it
+    already has. The fetch threads share one connection guarded by a lock.
+    """
+
+    def __init__(self, path, max_age=DEFAULT_PAGE_MAX_AGE):
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        # how many pages were used as is, confirmed unchanged by the server or downloaded during this run
+        self.counts = {"fresh": 0, "revalidated": 0, "downloaded": 0}
+        self.connection = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS pages ("
+                                "url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, fetched_at REAL, content BLOB)")
+        self.connection.commit()
+
+    def get(self, url):
+        """
+        Return (content, etag, last_modified, fresh) for a cached page or None.
+        fresh is True while the page is younger than max_age and can be used
+        without asking the server.
+        """
+        with self.lock:
+            row = self.connection.execute("SELECT content, etag, last_modified, fetched_at FROM pages WHERE url = ?",
+                                          (url,)).fetchone()
+        if row is None:
+            return None
+        content, etag, last_modified, fetched_at = row
+        return zlib.decompress(content), etag, last_modified, time.time() - fetched_at < self.max_age
+
+    def put(self, url, content, etag, last_modified):
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO pages (url, etag, last_modified, fetched_at, content) "
+                                    "VALUES (?, ?, ?, ?, ?)",
+                                    (url, etag, last_modified, time.time(), zlib.compress(content)))
+
+    def touch(self, url):
+        # the server confirmed the cached page is still current
+        with self.lock, self.connection:
+            self.connection.execute("UPDATE pages SET fetched_at = ? WHERE url = ?", (time.time(), url))
+
+    def count(self, outcome):
+        with self.lock:
+            self.counts[outcome] += 1
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,156 @@
+import queue
+import threading
+import time
+
+# markers that frame the items of each session as they flow through the stages
+SESSION_START = "start"
+SESSION_END = "end"
+# default number of items waiting between two stages
+DEFAULT_QUEUE_SIZE = 16
+
+# sent downstream once a stage has nothing more to hand on
+_DONE = ("done",)
+# sent downstream in place of the remaining items when a stage fails
+_ERROR = "error"
+
+
+class StageStats:
+    """
+    Counts the items a stage handled and the time it spent working on them, as
+    opposed to waiting on the stages around it.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.busy = 0.0
+
+    def report(self, elapsed):
+        rate = self.items / self.busy if self.busy > 0 else 0.0
+        return "%-10s %8d items %9.2fs busy (%5.1f%% of %.2fs) %10.1f items/s" % \
+            (self.name, self.items, self.busy, 100 * self.busy / elapsed if elapsed > 0 else 0.0, elapsed, rate)
+
+
+class Pipeline:
+    """
+    Runs a source and a chain of stages in their own threads connected by
+    bounded queues, so each stage works on the next item while the following
+    one is still busy and a slow stage holds the others back instead of
+    letting items pile up. Every stage is a single thread so items come out in
+    the order the source produced them.
+
+    Items are tuples whose first element says what they are. SESSION_START and
+    SESSION_END markers are handed on untouched; every other item is passed to
+    the stage's work function, which returns the item for the next stage or
+    None to drop it.
+
+    With a profiles list each thread runs under its own cProfile profiler,
+    which is added to the list, since cProfile only sees the thread it was
+    started in.
+    """
+
+    def __init__(self, queue_size=DEFAULT_QUEUE_SIZE, profiles=None):
+        self.queue_size = queue_size
+        self.profiles = profiles
+        self.threads = []
+        self.stats = []
+        self.outbox = None
+        self.started = None
+
+    def add_source(self, name, items):
+        stats = StageStats(name)
+        outbox = queue.Queue(self.queue_size)
+
+        def run_source():
+            try:
+                iterator = iter(items)
+                while True:
+                    start = time.perf_counter()
+                    item = next(iterator, _DONE)
+                    stats.busy += time.perf_counter() - start
+                    if item is _DONE:
+                        break
+                    if item[0] not in (SESSION_START, SESSION_END):
+                        stats.items += 1
+                    outbox.put(item)
+            except BaseException as e:
+                outbox.put((_ERROR, e))
+                return
+            outbox.put(_DONE)
+
+        self.add_thread(name, run_source, stats, outbox)
+
+    def add_stage(self, name, work):
+        stats = StageStats(name)
+        inbox = self.outbox
+        outbox = queue.Queue(self.queue_size)
+
+        def run_stage():
+            try:
+                while True:
+                    item = inbox.get()
+                    if item is _DONE or item[0] in (_ERROR, SESSION_START, SESSION_END):
+                        outbox.put(item)
+                        if item is _DONE or item[0] == _ERROR:
+                            return
+                        continue
+                    start = time.perf_counter()
+                    result = work(item)
+                    stats.busy += time.perf_counter() - start
+                    stats.items += 1
+                    if result is not None:
+                        outbox.put(result)
+            except BaseException as e:
+                outbox.put((_ERROR, e))
+
+        self.add_thread(name, run_stage, stats, outbox)
+
+    def add_thread(self, name, target, stats, outbox):
+        if self.profiles is not None:
+            target = self.profile_thread(target)
+        # the threads are daemons so a failure in the consumer doesn't leave the process waiting on them
+        self.threads.append(threading.Thread(target=target, name=name, daemon=True))
+        self.stats.append(stats)
+        self.outbox = outbox
+
+    def profile_thread(self, target):
+        import cProfile
+        profile = cProfile.Profile()
+        self.profiles.append(profile)
+
+        def run_profiled():
+            profile.runcall(target)
+
+        return run_profiled
+
+    def run(self, name):
+        """
+        Start the threads and yield the items coming out of the last stage.
+        The time the caller spends between items is counted as the work of a
+        final stage called name. A failure in any stage is raised here.
+        """
+        stats = StageStats(name)
+        self.stats.append(stats)
+        self.started = time.perf_counter()
+        for thread in self.threads:
+            thread.start()
+        while True:
+            item = self.outbox.get()
+            if item is _DONE:
+                break
+            if item[0] == _ERROR:
+                raise item[1]
+            start = time.perf_counter()
+            yield item
+            stats.busy += time.perf_counter() - start
+            if item[0] not in (SESSION_START, SESSION_END):
+                stats.items += 1
+        for thread in self.threads:
+            thread.join()
+
+    def get_stats(self):
+        return [{"name": stats.name, "items": stats.items, "busy_seconds": stats.busy} for stats in self.stats]
+
+    def report(self):
+        elapsed = time.perf_counter() - self.started
+        return "\n".join(stats.report(elapsed) for stats in self.stats)
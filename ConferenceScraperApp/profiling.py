@@ -0,0 +1,107 @@
+import copy
+import json
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+PROFILE_FORMAT = 1
+
+
+def new_totals():
+    return {"calls": 0, "seconds": 0.0, "bytes": 0}
+
+
+def add_totals(totals, stage, seconds, size):
+    entry = totals.setdefault(stage, new_totals())
+    entry["calls"] += 1
+    entry["seconds"] += seconds
+    entry["bytes"] += size
+
+
+class Profiler:
+    """
+    Adds up the wall time, number of calls and bytes handled by each stage of
+    a run, for the whole run, each session and each talk. The stages run in
+    different threads so everything is recorded under a lock. A talk is put
+    in its session by the first record that names both, and the records that
+    only name the talk are counted towards that session in the report.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.started_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        self.stages = {}
+        self.sessions = {}
+        self.talks = {}
+        self.talk_sessions = {}
+
+    def record(self, stage, seconds, size=0, session=None, talk=None):
+        with self.lock:
+            add_totals(self.stages, stage, seconds, size)
+            if talk is not None:
+                if session is not None:
+                    self.talk_sessions.setdefault(talk, session)
+                add_totals(self.talks.setdefault(talk, {}), stage, seconds, size)
+            elif session is not None:
+                add_totals(self.sessions.setdefault(session, {}), stage, seconds, size)
+
+    @contextmanager
+    def measure(self, stage, session=None, talk=None):
+        """
+        Time the body of a with statement as one call of stage. The body can
+        set the "bytes" of the dictionary it is given.
+        """
+        measured = {"bytes": 0}
+        start = time.perf_counter()
+        try:
+            yield measured
+        finally:
+            self.record(stage, time.perf_counter() - start, measured["bytes"], session, talk)
+
+    def get_report(self, extra=None):
+        with self.lock:
+            sessions = {session: {"talks": 0, "stages": {stage: dict(entry) for stage, entry in totals.items()}}
+                        for session, totals in self.sessions.items()}
+            talks = []
+            for talk, totals in self.talks.items():
+                session = self.talk_sessions.get(talk)
+                talks.append({"url": talk, "session": session, "stages": totals})
+                summary = sessions.setdefault(session, {"talks": 0, "stages": {}})
+                summary["talks"] += 1
+                for stage, entry in totals.items():
+                    session_entry = summary["stages"].setdefault(stage, new_totals())
+                    for key in entry:
+                        session_entry[key] += entry[key]
+            report = {
+                "format": PROFILE_FORMAT,
+                "started": self.started_at,
+                "wall_seconds": time.perf_counter() - self.started,
+                "stages": self.stages,
+                "sessions": sessions,
+                "talks": talks
+            }
+            if extra is not None:
+                report.update(extra)
+            # a copy so the stages can carry on recording while the report is written
+            return copy.deepcopy(report)
+
+    def save(self, path, extra=None):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.get_report(extra), f, indent=1)
+
+
+def record(profiler, stage, seconds, size=0, session=None, talk=None):
+    # the stages are called the same way with or without --profile
+    if profiler is not None:
+        profiler.record(stage, seconds, size, session, talk)
+
+
+@contextmanager
+def measure(profiler, stage, session=None, talk=None):
+    if profiler is None:
+        yield {"bytes": 0}
+    else:
+        with profiler.measure(stage, session, talk) as measured:
+            yield measured
@@ -0,0 +1,111 @@
+# Answer word frequency questions from the index written by a run with --cache and --frequencyIndex.
+# Usage: python ConferenceScraperApp/query_index.py --cache <CACHE_DIRECTORY> [-l <LANGUAGE>] [-y <YEAR>]
+#        [-m <MONTH>] [--speaker <NAME>] [--excludeSpeaker <NAME>] [--newSince <YYYY-MM>] [--limit <NUM>]
+#        [-o <OUTPUT>] [--format <tsv|csv|jsonl>]
+# EXAMPLE top words of 2019-2022 without one speaker:
+#        query_index.py --cache cache -l spa -y 2019-2022 --excludeSpeaker "Dieter F. Uchtdorf"
+# EXAMPLE words first used in or after October 2020: query_index.py --cache cache -l spa --newSince 2020-10
+import os
+import sys
+import getopt
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ConferenceScraperApp.app import parse_years, parse_months
+from ConferenceScraperApp.frequency_index import FrequencyIndex, get_frequency_index_path, get_session_key
+from ConferenceScraperApp.output import open_output, write_rows
+
+
+def usage():
+    print("query_index --cache <CACHE_DIRECTORY> [-l <LANGUAGE>] [-y <YEAR>] [-m <MONTH>] [--speaker <NAME>] "
+          "[--excludeSpeaker <NAME>] [--newSince <YYYY-MM>] [--limit <NUM>] [-o <OUTPUT>] "
+          "[--format <tsv|csv|jsonl>]")
+
+
+def run(argv):
+    lang = "eng"
+    year = None
+    month = "04,10"
+    cache_directory = None
+    speakers = []
+    exclude_speakers = []
+    new_since = None
+    limit = 100
+    output = None
+    output_format = "tsv"
+    verbose = False
+    try:
+        opts, args = getopt.getopt(argv, "l:y:m:o:hv", ["language=", "year=", "month=", "output=", "verbose", "cache=",
+                                                        "speaker=", "excludeSpeaker=", "newSince=", "limit=",
+                                                        "format="])
+    except getopt.GetoptError as err:
+        print(err)
+        usage()
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt == "-h":
+            usage()
+            sys.exit()
+        elif opt in ("-l", "--language"):
+            lang = arg
+        elif opt in ("-y", "--year"):
+            year = arg.replace(" ", "")
+        elif opt in ("-m", "--month"):
+            month = arg.replace(" ", "")
+        elif opt in ("-o", "--output"):
+            output = arg
+        elif opt in ("-v", "--verbose"):
+            verbose = True
+        elif opt == "--cache":
+            cache_directory = arg
+            if not os.path.isfile(get_frequency_index_path(cache_directory)):
+                assert False, "No frequency index in the cache directory. Run with --frequencyIndex first"
+        elif opt == "--speaker":
+            speakers.append(arg)
+        elif opt == "--excludeSpeaker":
+            exclude_speakers.append(arg)
+        elif opt == "--newSince":
+            new_since = arg
+        elif opt == "--limit":
+            limit = int(arg)
+            if limit < 1:
+                assert False, "limit must be at least 1"
+        elif opt == "--format":
+            output_format = arg
+            if output_format not in ("tsv", "csv", "jsonl"):
+                assert False, "format must be one of tsv, csv, jsonl"
+        else:
+            assert False, "unhandled option"
+    if cache_directory is None:
+        usage()
+        sys.exit(2)
+
+    # without -y every session in the index is included
+    sessions = None
+    if year is not None:
+        months = parse_months(month)
+        if months is None:
+            assert False, "Invalid month specified"
+        sessions = [get_session_key(session_year, session_month) for session_year in parse_years(year)
+                    for session_month in months]
+
+    index = FrequencyIndex(get_frequency_index_path(cache_directory))
+    start = time.perf_counter()
+    rows = index.top_words(lang, sessions, speakers, exclude_speakers, new_since, limit)
+    elapsed = time.perf_counter() - start
+    index.close()
+
+    columns = [("count", "WORD COUNT"), ("word", "WORD")]
+    rows = [[count, word] for word, count in rows]
+    if output is not None:
+        f = open_output(output, output_format)
+        write_rows(f, output_format, columns, rows)
+        f.close()
+    else:
+        write_rows(sys.stdout, output_format, columns, rows)
+    if verbose:
+        print("%s words in %.1f ms" % (len(rows), elapsed * 1000))
+
+
+if __name__ == '__main__':
+    run(sys.argv[1:])
@@ -0,0 +1,350 @@
+import io
+import re
+import json
+import time
+import threading
+import traceback
+from datetime import date
+from collections import OrderedDict
+from urllib.parse import urlsplit, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from ConferenceScraperApp import app
+from ConferenceScraperApp.claims import SessionClaim, get_claim_path, get_claim_owner, is_own_claim
+from ConferenceScraperApp.aggregates import AggregateStore, get_aggregate_store_path
+from ConferenceScraperApp.word_store import WordFeatures, SENTENCE_POLICIES
+from ConferenceScraperApp.output import OUTPUT_FORMATS, GROUP_BY, write_rows
+from ConferenceScraperApp.frequency_index import get_session_key
+
+# the merged word lists of the last queries, so asking again for the same sessions doesn't merge them again
+MERGED_CACHE_SIZE = 8
+# a session without talks (e.g. one that hasn't happened yet) is looked for again after this many seconds
+EMPTY_SESSION_RETRY = 3600
+JSON_TYPE = "application/json; charset=utf-8"
+TEXT_TYPE = "text/plain; charset=utf-8"
+# the options the sessions are processed with come from the query, not from the command line of the server
+SESSION_FLAGS = ("--includeLemma", "--includeTransliteration")
+
+
+class QueryError(Exception):
+    """
+    A query that can't be answered, sent back with its HTTP status and the
+    message.
+    """
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def get_flag(params, name, default=False):
+    if name not in params:
+        return default
+    return params[name].lower() in ("1", "true", "yes", "")
+
+
+def get_number(params, name, default=None, minimum=None):
+    if name not in params:
+        return default
+    try:
+        value = int(params[name])
+    except ValueError:
+        raise QueryError("%s must be a number" % name)
+    if minimum is not None and value < minimum:
+        raise QueryError("%s must be at least %s" % (name, minimum))
+    return value
+
+
+class WordListService:
+    """
+    Answers word list queries from the sessions saved with --incremental. A
+    session is read from the aggregate store once and kept in memory, and a
+    session that hasn't been saved yet is processed first with the options
+    the server was started with, using models that stay loaded from one
+    query to the next. The sessions of a language are processed one at a
+    time, while queries that only need sessions already in memory are
+    answered at once.
+    """
+
+    def __init__(self, argv, cache_directory, web_client, show_lemma, show_transliteration, sentence_limit, seed,
+                 sentence_policy, translation_dictionary, translation_workers):
+        self.argv = [arg for arg in argv if arg not in SESSION_FLAGS]
+        self.cache_directory = cache_directory
+        self.web_client = web_client
+        self.show_lemma = show_lemma
+        self.show_transliteration = show_transliteration
+        self.sentence_limit = sentence_limit
+        self.seed = seed
+        self.sentence_policy = sentence_policy
+        self.translation_dictionary = translation_dictionary
+        self.translation_workers = translation_workers
+        self.models = {}
+        self.lock = threading.Lock()
+        self.language_locks = {}
+        # (lang, year, month, settings_key) to the WordFeatures of the session
+        self.sessions = {}
+        # the same keys to when the session was found without talks
+        self.empty_sessions = {}
+        self.merged = OrderedDict()
+        # one connection to the aggregate store for every query, and the settings key of each (lang, flags)
+        self.store = AggregateStore(get_aggregate_store_path(cache_directory), check_same_thread=False)
+        self.store_lock = threading.Lock()
+        self.settings_keys = {}
+        # the random example sentences of a seeded server are picked one query at a time
+        self.output_lock = threading.Lock()
+        self.started = time.time()
+        self.queries = 0
+
+    def get_language_lock(self, lang):
+        with self.lock:
+            return self.language_locks.setdefault(lang, threading.Lock())
+
+    def load_models(self, lang, show_lemma):
+        with self.get_language_lock(lang):
+            nlp, language_data = app.get_language_processing(self.models, app.available_languages[lang]["pos"],
+                                                             app.available_languages[lang]["iso_one"], show_lemma)
+            if isinstance(nlp, app.LazyPipeline):
+                nlp.get_pipeline()
+
+    def get_settings(self, lang, show_lemma, show_transliteration):
+        """
+        Return the settings key of the sessions saved with these options and
+        whether transliteration is shown, which it is only for the languages
+        transliterate supports. Both are worked out once.
+        """
+        settings = self.settings_keys.get((lang, show_lemma, show_transliteration))
+        if settings is None:
+            iso_one = app.available_languages[lang]["iso_one"]
+            pos_support = app.available_languages[lang]["pos"]
+            transliterated = False
+            if show_transliteration:
+                from transliterate import get_available_language_codes
+                transliterated = iso_one in get_available_language_codes()
+            settings = (self.store.get_settings_key(app.get_pipeline_key(pos_support, iso_one, show_lemma),
+                                                    transliterated), transliterated)
+            with self.lock:
+                self.settings_keys[(lang, show_lemma, show_transliteration)] = settings
+        return settings
+
+    def has_session(self, lang, year, month, settings_key):
+        with self.store_lock:
+            return self.store.has_session(lang, year, month, settings_key)
+
+    def get_session(self, lang, year, month, show_lemma, show_transliteration):
+        """
+        Return the WordFeatures of a session, processing it first if it
+        hasn't been saved, or None when the session has no talks.
+        """
+        key = (lang, year, month, self.get_settings(lang, show_lemma, show_transliteration)[0])
+        word_features = self.sessions.get(key)
+        if word_features is not None:
+            return word_features
+        checked = self.empty_sessions.get(key)
+        if checked is not None and time.time() - checked < EMPTY_SESSION_RETRY:
+            return None
+        with self.get_language_lock(lang):
+            # another query may have read it while this one waited
+            word_features = self.sessions.get(key)
+            if word_features is not None:
+                return word_features
+            if not self.has_session(*key):
+                argv = self.argv + ["-l", lang, "-y", year, "-m", month, "--incremental"]
+                if show_lemma:
+                    argv.append("--includeLemma")
+                if show_transliteration:
+                    argv.append("--includeTransliteration")
+                processed = app.run(argv, self.web_client, True, self.models)
+                claim_path = get_claim_path(self.cache_directory, *key)
+                if not processed and is_own_claim(claim_path):
+                    # the language lock keeps the other queries of this server off the session, so a claim
+                    # of its own was left by a run that didn't finish and the session is processed again
+                    SessionClaim(claim_path).release()
+                    processed = app.run(argv, self.web_client, True, self.models)
+                if not processed:
+                    raise QueryError("%s %s is being processed by %s, try again later" %
+                                     (month, year, get_claim_owner(claim_path)), 503)
+            if not self.has_session(*key):
+                self.empty_sessions[key] = time.time()
+                return None
+            with self.store_lock:
+                word_list, word_features = self.store.load_session(*key)
+            self.sessions[key] = word_features
+            self.empty_sessions.pop(key, None)
+            return word_features
+
+    def get_merged(self, lang, sessions, settings):
+        """
+        Return the word_list, word_features and per session counts of the
+        sessions merged in order, from the last queries when they asked for
+        the same sessions, along with the state of the random generator once
+        they are merged.
+        """
+        key = (lang, settings, tuple(session_key for session_key, word_features in sessions))
+        with self.lock:
+            merged = self.merged.get(key)
+            if merged is not None:
+                self.merged.move_to_end(key)
+                return merged
+        word_features = WordFeatures(self.sentence_limit, seed=self.seed)
+        word_list = word_features.counts
+        session_counts = {}
+        for session_key, session_features in sessions:
+            word_list, word_features = app.merge_lists(word_list, word_features, session_features.counts,
+                                                       session_features)
+            session_counts[session_key] = session_features.counts
+            word_features.trim_sentences()
+        # the merged words are kept for the next queries with only the sentences they refer to
+        word_features.trim_sentences(True)
+        # the examples of every query are picked from this state, which is where a run of the script with the
+        # same --seed picks them from
+        state = word_features.generator.getstate() if word_features.generator is not None else None
+        merged = (word_list, word_features, session_counts, state)
+        with self.lock:
+            self.merged[key] = merged
+            while len(self.merged) > MERGED_CACHE_SIZE:
+                self.merged.popitem(last=False)
+        return merged
+
+    def query(self, params):
+        """
+        Answer a word list query with its content type and body. The
+        parameters are named like the options of the script.
+        """
+        lang = params.get("lang", params.get("language", "eng"))
+        if lang not in app.available_languages:
+            raise QueryError("Unknown language %s" % lang)
+        # the sessions end up in file names so only plain years and months are taken
+        years = app.parse_years(params.get("year", str(date.today().year)).replace(" ", ""))
+        if len(years) == 0 or not all(re.fullmatch(r"\d\d\d\d", year) for year in years):
+            raise QueryError("Invalid year specified")
+        months = app.parse_months(params.get("month", "04,10").replace(" ", ""))
+        if months is None or not all(month in ("04", "10") for month in months):
+            raise QueryError("Invalid month specified")
+        output_format = params.get("format")
+        if output_format is not None and output_format not in OUTPUT_FORMATS:
+            raise QueryError("format must be one of %s" % ", ".join(OUTPUT_FORMATS))
+        group_by = params.get("groupBy", "word")
+        if group_by not in GROUP_BY:
+            raise QueryError("groupBy must be one of %s" % ", ".join(GROUP_BY))
+        sentence_policy = params.get("sentencePolicy", self.sentence_policy)
+        if sentence_policy not in SENTENCE_POLICIES:
+            raise QueryError("sentencePolicy must be one of %s" % ", ".join(SENTENCE_POLICIES))
+        limit = get_number(params, "limit", None, 1)
+        min_translation = get_number(params, "translateMin", 0, 0)
+        max_translation = get_number(params, "translateMax", min_translation if min_translation > 0 else None)
+        show_translation = min_translation > 0 and lang != "eng"
+        show_lemma = get_flag(params, "includeLemma", self.show_lemma)
+        show_transliteration = get_flag(params, "includeTransliteration", self.show_transliteration)
+        settings_key, transliterated = self.get_settings(lang, show_lemma, show_transliteration)
+        iso_one = app.available_languages[lang]["iso_one"]
+
+        sessions = []
+        for year in years:
+            for month in months:
+                word_features = self.get_session(lang, year, month, show_lemma, show_transliteration)
+                if word_features is not None:
+                    sessions.append((get_session_key(year, month), word_features))
+        word_list, word_features, session_counts, state = self.get_merged(lang, sessions, settings_key)
+        translations = None
+        if show_translation:
+            translations = app.create_translations(self.translation_dictionary, self.translation_workers,
+                                                   self.cache_directory, lang)
+        columns, rows = app.get_output_rows(word_list, word_features, get_flag(params, "hideCount"),
+                                            transliterated, show_lemma, show_translation,
+                                            get_flag(params, "showPOS"), get_flag(params, "showSentence"),
+                                            max_translation, min_translation, limit, translations, group_by,
+                                            session_counts if group_by == "session" else None, iso_one,
+                                            sentence_policy)
+        if state is not None:
+            # the merged words are shared by the queries so each one starts from the state after the merge
+            with self.output_lock:
+                word_features.generator.setstate(state)
+                rows = list(rows)
+        else:
+            rows = list(rows)
+        with self.lock:
+            self.queries += 1
+
+        if output_format is not None:
+            f = io.StringIO()
+            write_rows(f, output_format, columns, rows)
+            return TEXT_TYPE, f.getvalue().encode("utf-8")
+        return JSON_TYPE, json.dumps({
+            "lang": lang,
+            "sessions": [session_key for session_key, session_features in sessions],
+            "columns": [column for column, header in columns],
+            "rows": rows
+        }, ensure_ascii=False).encode("utf-8")
+
+    def close(self):
+        self.store.close()
+
+    def get_status(self):
+        with self.lock:
+            return {
+                "uptime_seconds": time.time() - self.started,
+                "queries": self.queries,
+                "sessions": sorted("%s %s" % (lang, get_session_key(year, month))
+                                   for lang, year, month, settings_key in self.sessions),
+                "models": sorted(iso_one for pos_support, iso_one, show_lemma in self.models)
+            }
+
+
+class WordListHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = {name: values[-1] for name, values in parse_qs(url.query, keep_blank_values=True).items()}
+        status = 200
+        try:
+            if url.path == "/words":
+                content_type, body = self.server.service.query(params)
+            elif url.path == "/status":
+                content_type, body = JSON_TYPE, json.dumps(self.server.service.get_status()).encode("utf-8")
+            else:
+                raise QueryError("Unknown path %s, use /words or /status" % url.path, 404)
+        except QueryError as err:
+            status = err.status
+            content_type, body = JSON_TYPE, json.dumps({"error": str(err)}).encode("utf-8")
+        except Exception as err:
+            # a query that fails is answered with the error instead of stopping the server
+            traceback.print_exc()
+            status = 500
+            content_type, body = JSON_TYPE, json.dumps({"error": repr(err)}).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class WordListServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 64
+
+
+def serve_words(address, argv, languages, cache_directory, web_client, show_lemma, show_transliteration,
+                sentence_limit, seed, sentence_policy, translation_dictionary, translation_workers, verbose):
+    """
+    Answer word list queries at address, a (host, port), until interrupted.
+    The models of languages are loaded before the first query.
+    """
+    service = WordListService(argv, cache_directory, web_client, show_lemma, show_transliteration, sentence_limit,
+                              seed, sentence_policy, translation_dictionary, translation_workers)
+    for lang in languages:
+        print("Loading the models for %s" % lang)
+        service.load_models(lang, show_lemma)
+    server = WordListServer(address, WordListHandler)
+    server.service = service
+    server.verbose = verbose
+    print("Serving word lists at http://%s:%s/words" % server.server_address[:2])
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
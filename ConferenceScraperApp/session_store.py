@@ -0,0 +1,98 @@
+import json
+import os
+import re
+import sqlite3
+import zlib
+
+SESSION_STORE_FILENAME = "sessions.sqlite3"
+# matches the <lang>_<year>_<month>.json files written by the json cache format
+JSON_CACHE_PATTERN = re.compile(r"^([a-z]{3})_(\d{4})_(\d{2})\.json$")
+
+
+def get_session_store_path(cache_directory):
+    return os.path.join(cache_directory, SESSION_STORE_FILENAME)
+
+
+class SessionStore:
+    """
+    A single file cache of scraped sessions indexed by (lang, year, month) and
+    talk url. Each talk is its own row with the paragraphs stored as zlib
+    compressed json, so a session can be read one talk at a time without
+    loading the whole session into memory.
+    """
+
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path, timeout=60)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS sessions ("
+                                "lang TEXT, year TEXT, month TEXT, base_url TEXT, "
+                                "PRIMARY KEY (lang, year, month))")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS talks ("
+                                "lang TEXT, year TEXT, month TEXT, position INTEGER, url TEXT, "
+                                "title TEXT, speaker TEXT, role TEXT, summary TEXT, paragraphs BLOB, "
+                                "PRIMARY KEY (lang, year, month, position))")
+        self.connection.execute("CREATE UNIQUE INDEX IF NOT EXISTS talks_url ON talks (lang, year, month, url)")
+        self.connection.commit()
+
+    def has_session(self, lang, year, month):
+        row = self.connection.execute("SELECT 1 FROM sessions WHERE lang = ? AND year = ? AND month = ?",
+                                      (lang, year, month)).fetchone()
+        return row is not None
+
+    def iter_talks(self, lang, year, month):
+        """
+        Yield the talks of a session in their original order in the same
+        shape as the talks of the json cache format.
+        """
+        # the positions are read up front and each talk on its own, so no statement stays open between talks.
+        # an open statement holds a read lock that would keep another connection from saving a session
+        positions = [row[0] for row in self.connection.execute("SELECT position FROM talks "
+                                                               "WHERE lang = ? AND year = ? AND month = ? "
+                                                               "ORDER BY position", (lang, year, month)).fetchall()]
+        for position in positions:
+            url, title, speaker, role, summary, paragraphs = self.connection.execute(
+                "SELECT url, title, speaker, role, summary, paragraphs FROM talks "
+                "WHERE lang = ? AND year = ? AND month = ? AND position = ?",
+                (lang, year, month, position)).fetchall()[0]
+            yield {
+                "url": url,
+                "title": title,
+                "speaker": speaker,
+                "role": role,
+                "summary": summary,
+                "paragraphs": json.loads(zlib.decompress(paragraphs).decode("utf-8"))
+            }
+
+    def save_session(self, session_json):
+        key = (session_json["language"], session_json["year"], session_json["month"])
+        with self.connection:
+            self.connection.execute("DELETE FROM talks WHERE lang = ? AND year = ? AND month = ?", key)
+            self.connection.execute("INSERT OR REPLACE INTO sessions (lang, year, month, base_url) VALUES (?, ?, ?, ?)",
+                                    key + (session_json["base_url"],))
+            self.connection.executemany(
+                "INSERT INTO talks (lang, year, month, position, url, title, speaker, role, summary, paragraphs) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [key + (position, talk["url"], talk["title"], talk["speaker"], talk["role"], talk["summary"],
+                        zlib.compress(json.dumps(talk["paragraphs"], ensure_ascii=False).encode("utf-8")))
+                 for position, talk in enumerate(session_json["talks"])])
+
+    def close(self):
+        self.connection.close()
+
+
+def migrate_json_cache(cache_directory, store, verbose=False):
+    """
+    Copy every <lang>_<year>_<month>.json session in cache_directory into the
+    store. The json files are left in place. Returns the number of sessions
+    that were migrated.
+    """
+    migrated = 0
+    for filename in sorted(os.listdir(cache_directory)):
+        if not JSON_CACHE_PATTERN.match(filename):
+            continue
+        with open(os.path.join(cache_directory, filename), "r") as f:
+            session_json = json.load(f)
+        store.save_session(session_json)
+        migrated += 1
+        if verbose:
+            print("Migrated %s (%s talks)" % (filename, len(session_json["talks"])))
+    return migrated
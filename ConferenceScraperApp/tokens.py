@@ -0,0 +1,67 @@
+import json
+import os
+from collections import OrderedDict
+from ConferenceScraperApp.files import save_json
+
+# number of tokens kept by each lookup cache before the least recently used are dropped
+TOKEN_CACHE_SIZE = 100000
+
+
+def get_token_cache_path(cache_directory, lang):
+    return os.path.join(cache_directory, "tokens_%s.json" % lang)
+
+
+class TokenCache:
+    """
+    A bounded least recently used memo of a lookup done for each token, such
+    as its lemma or transliteration. The same surface forms come up in every
+    talk of every session so most lookups are answered from the cache. A
+    max_entries of 0 turns the cache off and every lookup is done again.
+    """
+
+    def __init__(self, max_entries=TOKEN_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, word, function, *args):
+        value = self.entries.get(word)
+        if value is not None:
+            self.hits += 1
+            self.entries.move_to_end(word)
+            return value
+        self.misses += 1
+        value = function(word, *args)
+        if self.max_entries > 0:
+            self.entries[word] = value
+            if len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return value
+
+    def load(self, entries):
+        self.entries.update(entries[-self.max_entries:] if self.max_entries > 0 else [])
+
+
+def load_token_caches(path, key, caches):
+    """
+    Fill caches, a dictionary of name to TokenCache, from a file written by
+    save_token_caches. The file is ignored when it was written for a different
+    key, which names the language and library versions behind the lookups.
+    """
+    if not os.path.exists(path):
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        saved = json.load(f)
+    if saved.get("key") != key:
+        return
+    for name, cache in caches.items():
+        cache.load(saved.get(name, []))
+
+
+def save_token_caches(path, key, caches):
+    saved = {"key": key}
+    for name, cache in caches.items():
+        # saved from least to most recently used so loading keeps the order
+        saved[name] = list(cache.entries.items())
+    save_json(path, saved)
@@ -0,0 +1,135 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from ConferenceScraperApp.files import save_json
+
+# number of words sent to the translation backend in a single request
+TRANSLATION_BATCH_SIZE = 50
+# number of translations kept in the persistent cache before the least recently used are dropped
+TRANSLATION_CACHE_SIZE = 50000
+
+
+def get_translation_cache_path(cache_directory, lang, dest):
+    return os.path.join(cache_directory, "translations_%s_%s.json" % (lang, dest))
+
+
+class GoogleTranslateBackend:
+    """
+    Translate with py-googletrans. A batch of words is sent as a single text
+    with one word per line, and each thread gets its own Translator because
+    they aren't safe to share.
+    """
+
+    def __init__(self):
+        self.local = threading.local()
+
+    def get_translator(self):
+        if not hasattr(self.local, "translator"):
+            from googletrans import Translator
+            self.local.translator = Translator()
+        return self.local.translator
+
+    def translate(self, words, dest):
+        translator = self.get_translator()
+        text = get_text(translator.translate("\n".join(words), dest=dest))
+        lines = text.split("\n")
+        if text and len(lines) == len(words):
+            return [line.strip() for line in lines]
+        # nothing or not one line per word came back so fall back to a request per word
+        return [get_text(translator.translate(word, dest=dest)).strip() for word in words]
+
+
+def get_text(result):
+    # googletrans sometimes answers without a text
+    return result.text if result is not None and result.text is not None else ""
+
+
+class DictionaryBackend:
+    """
+    Translate from a local file so translations work offline. The file is either
+    a json object mapping words to translations or tab separated lines of word
+    and translation. Words that aren't in the file get an empty translation.
+    """
+
+    def __init__(self, path):
+        with open(path, "r", encoding="utf-8") as f:
+            if path.endswith(".json"):
+                entries = json.load(f)
+            else:
+                entries = dict(line.rstrip("\n").split("\t", 1) for line in f if "\t" in line)
+        self.entries = {word.lower(): translation for word, translation in entries.items()}
+
+    def translate(self, words, dest):
+        return [self.entries.get(word.lower(), "") for word in words]
+
+
+class TranslationCache:
+    """
+    A persistent least recently used cache of translations for one language
+    pair. Once it holds more than max_entries translations the ones that
+    haven't been used for the longest are dropped when it is saved.
+    """
+
+    def __init__(self, path, max_entries=TRANSLATION_CACHE_SIZE):
+        self.path = path
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.entries.update(json.load(f))
+
+    def get(self, word):
+        translation = self.entries.get(word)
+        if translation is not None:
+            self.entries.move_to_end(word)
+        return translation
+
+    def put(self, word, translation):
+        self.entries[word] = translation
+        self.entries.move_to_end(word)
+
+    def save(self):
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        save_json(self.path, self.entries)
+
+
+class Translations:
+    """
+    Translate word lists with a backend, in batches spread over a bounded pool
+    of threads, skipping the words that are already in the cache.
+    """
+
+    def __init__(self, backend, cache, workers, dest="en"):
+        self.backend = backend
+        self.cache = cache
+        self.workers = workers
+        self.dest = dest
+
+    def translate(self, words):
+        translations = {}
+        missing = []
+        for word in words:
+            translation = self.cache.get(word) if self.cache is not None else None
+            if translation is not None:
+                translations[word] = translation
+            else:
+                missing.append(word)
+
+        batches = [missing[start:start + TRANSLATION_BATCH_SIZE]
+                   for start in range(0, len(missing), TRANSLATION_BATCH_SIZE)]
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                results = executor.map(lambda batch: self.backend.translate(batch, self.dest), batches)
+                for batch, batch_translations in zip(batches, results):
+                    for word, translation in zip(batch, batch_translations):
+                        translations[word] = translation
+                        if self.cache is not None:
+                            self.cache.put(word, translation)
+        finally:
+            # keep whatever was translated even if a later batch failed
+            if self.cache is not None and len(missing) > 0:
+                self.cache.save()
+        return translations
@@ -0,0 +1,409 @@
+import random
+from array import array
+
+# default number of example sentences kept for each word
+DEFAULT_SENTENCE_LIMIT = 10
+# how the example sentence of a word is picked for the output
+SENTENCE_POLICIES = ("random", "shortest", "representative")
+DEFAULT_SENTENCE_POLICY = "random"
+# the lemma counts are keyed by ids packed into a single integer, the word id in the low bits
+WORD_ID_BITS = 32
+LEMMA_ID_BITS = 32
+
+
+class SentenceStore:
+    """
+    Keeps a single copy of each distinct sentence and hands out an integer id
+    for it. Words refer to their example sentences by id so a sentence shared
+    by many words is only stored once.
+    """
+
+    def __init__(self, sentences=None):
+        self.sentences = sentences if sentences is not None else []
+        self.ids = {sentence: sentence_id for sentence_id, sentence in enumerate(self.sentences)}
+
+    def add(self, sentence):
+        sentence_id = self.ids.get(sentence)
+        if sentence_id is None:
+            sentence_id = len(self.sentences)
+            self.sentences.append(sentence)
+            self.ids[sentence] = sentence_id
+        return sentence_id
+
+    def get(self, sentence_id):
+        return self.sentences[sentence_id]
+
+    def get_length(self, sentence_id):
+        return len(self.sentences[sentence_id])
+
+    def __len__(self):
+        return len(self.sentences)
+
+
+class StringTable:
+    """
+    Hands out a single shared copy of each distinct value, so the parts of
+    speech, feats and lemmas repeated by thousands of words are stored once
+    rather than once for every word that was read with its own copy.
+    """
+
+    def __init__(self):
+        self.values = {}
+
+    def intern(self, value):
+        return self.values.setdefault(value, value)
+
+    def __len__(self):
+        return len(self.values)
+
+
+class IdTable:
+    """
+    Numbers each distinct value in the order it was first seen.
+    """
+
+    def __init__(self):
+        self.ids = {}
+        self.values = []
+
+    def get_id(self, value):
+        value_id = self.ids.get(value)
+        if value_id is None:
+            value_id = len(self.values)
+            self.ids[value] = value_id
+            self.values.append(value)
+        return value_id
+
+    def __len__(self):
+        return len(self.values)
+
+
+class WordEntry:
+    """
+    The features of a single word. Slots instead of a dictionary per word keep
+    the per-word overhead to a few pointers.
+    """
+    __slots__ = ("raw", "sentences", "sentence_count", "shortest", "pos", "upos", "xpos", "feats", "lemma",
+                 "transliteration")
+
+    def __init__(self, raw, sentences, sentence_count, shortest, pos, upos, xpos, feats, lemma, transliteration):
+        self.raw = raw
+        self.sentences = sentences
+        self.sentence_count = sentence_count
+        self.shortest = shortest
+        self.pos = pos
+        self.upos = upos
+        self.xpos = xpos
+        self.feats = feats
+        self.lemma = lemma
+        self.transliteration = transliteration
+
+    def to_list(self):
+        return [getattr(self, name) for name in self.__slots__]
+
+
+class WordCounts:
+    """
+    The word_list of a WordFeatures: the count of each lowercase word, read
+    and updated like a dictionary but kept in an array indexed by word id.
+    """
+    __slots__ = ("features",)
+
+    def __init__(self, features):
+        self.features = features
+
+    def __getitem__(self, lcase):
+        return self.features.word_counts[self.features.ids[lcase]]
+
+    def __setitem__(self, lcase, count):
+        self.features.word_counts[self.features.get_id(lcase)] = count
+
+    def __contains__(self, lcase):
+        return lcase in self.features.ids
+
+    def __len__(self):
+        return len(self.features.words)
+
+    def __iter__(self):
+        return iter(self.features.words)
+
+    def get(self, lcase, default=None):
+        word_id = self.features.ids.get(lcase)
+        return default if word_id is None else self.features.word_counts[word_id]
+
+    def keys(self):
+        return iter(self.features.words)
+
+    def values(self):
+        return iter(self.features.word_counts)
+
+    def items(self):
+        return zip(self.features.words, self.features.word_counts)
+
+
+class WordFeatures:
+    """
+    The vocabulary of a run along with the sentence store its entries point
+    into. Every lowercase word gets an integer id the first time it is seen;
+    its count is kept in an array and its features in a WordEntry at that id,
+    so the words are only hashed once for both. The counts are handed out as
+    a WordCounts, used as word_list, and the entries are read and set like a
+    dictionary of lowercase word to WordEntry.
+
+    Each word keeps at most sentence_limit example sentence ids, chosen as a
+    reservoir sample of the sentences it appeared in, the number of sentences
+    it was seen in and the shortest of them, so get_example picks a sentence
+    by any of the SENTENCE_POLICIES from what is already stored. With a seed
+    the samples and the random examples are the same on every run. The
+    sentences that no word refers to any more are dropped by trim_sentences.
+
+    The counts are also kept by lemma and by lemma and universal part of
+    speech, for each lowercase form behind them, so the words can be grouped
+    either way without processing them again. Rather than a dictionary of
+    forms for every lemma these are a single dictionary keyed by the lemma,
+    part of speech and word ids packed together, and get_lemmas and
+    get_lemma_pos group them when the output is written.
+    """
+
+    def __init__(self, sentence_limit=DEFAULT_SENTENCE_LIMIT, sentences=None, seed=None):
+        self.sentence_limit = sentence_limit
+        self.sentences = SentenceStore(sentences)
+        # the size of the sentence store after it was last trimmed
+        self.trimmed_size = len(self.sentences)
+        self.generator = random.Random(seed) if seed is not None else None
+        self.strings = StringTable()
+        self.ids = {}
+        self.words = []
+        self.word_counts = array("q")
+        self.entries = []
+        self.counts = WordCounts(self)
+        self.lemma_table = IdTable()
+        self.upos_table = IdTable()
+        self.lemma_counts = {}
+        self.lemma_pos_counts = {}
+
+    def get_id(self, lcase):
+        word_id = self.ids.get(lcase)
+        if word_id is None:
+            word_id = len(self.words)
+            self.ids[lcase] = word_id
+            self.words.append(lcase)
+            self.word_counts.append(0)
+            self.entries.append(None)
+        return word_id
+
+    def __getitem__(self, lcase):
+        return self.entries[self.ids[lcase]]
+
+    def __setitem__(self, lcase, entry):
+        self.entries[self.get_id(lcase)] = entry
+
+    def __contains__(self, lcase):
+        return lcase in self.ids
+
+    def __len__(self):
+        return len(self.words)
+
+    def __iter__(self):
+        return iter(self.words)
+
+    def keys(self):
+        return iter(self.words)
+
+    def items(self):
+        return zip(self.words, self.entries)
+
+    def new_entry(self, word, sentence, pos, upos, xpos, feats, lemma, transliteration):
+        intern = self.strings.intern
+        sentence_id = self.sentences.add(sentence)
+        return WordEntry([word], [sentence_id], 1, sentence_id, intern(pos), intern(upos), intern(xpos),
+                         intern(feats), intern(lemma), transliteration)
+
+    def get_random(self):
+        return self.generator if self.generator is not None else random
+
+    def add_sentence(self, features, sentence):
+        self.add_sentence_id(features, self.sentences.add(sentence), 1)
+
+    def add_sentence_id(self, features, sentence_id, weight):
+        """
+        Offer a sentence to the word's sample. weight is the number of
+        sentences the offered one stands for, which is more than one when
+        merging a sample taken from another store.
+        """
+        sample = features.sentences
+        # the sample is small so checking it is cheap, and it catches a word repeated within a sentence
+        if sentence_id in sample:
+            return
+        self.offer_shortest(features, sentence_id)
+        features.sentence_count += weight
+        if len(sample) < self.sentence_limit:
+            sample.append(sentence_id)
+        else:
+            slot = int(self.get_random().random() * features.sentence_count)
+            if slot < self.sentence_limit:
+                sample[slot] = sentence_id
+
+    def offer_shortest(self, features, sentence_id):
+        # the first of the shortest sentences is kept
+        if self.sentences.get_length(sentence_id) < self.sentences.get_length(features.shortest):
+            features.shortest = sentence_id
+
+    def count_lemma(self, lcase, lemma, upos, count=1):
+        # without a lemma (NLTK without --includeLemma) the word stands for its own lemma
+        lemma_id = self.lemma_table.get_id(lemma.lower() if lemma else lcase)
+        key = lemma_id << WORD_ID_BITS | self.get_id(lcase)
+        self.lemma_counts[key] = self.lemma_counts.get(key, 0) + count
+        key |= self.upos_table.get_id(upos or "") << (LEMMA_ID_BITS + WORD_ID_BITS)
+        self.lemma_pos_counts[key] = self.lemma_pos_counts.get(key, 0) + count
+
+    def merge_lemmas(self, other):
+        # the ids of the other store are translated into the ids of this one
+        for counts, other_counts, with_upos in ((self.lemma_counts, other.lemma_counts, False),
+                                                (self.lemma_pos_counts, other.lemma_pos_counts, True)):
+            for other_key, count in other_counts.items():
+                upos_id, lemma_id, word_id = unpack_lemma_key(other_key)
+                key = self.lemma_table.get_id(other.lemma_table.values[lemma_id]) << WORD_ID_BITS | \
+                    self.get_id(other.words[word_id])
+                if with_upos:
+                    key |= self.upos_table.get_id(other.upos_table.values[upos_id]) << (LEMMA_ID_BITS + WORD_ID_BITS)
+                counts[key] = counts.get(key, 0) + count
+
+    def get_lemmas(self):
+        """
+        Return the counts grouped by lemma, each mapping the lowercase forms
+        behind it to their counts.
+        """
+        lemmas = {}
+        for key, count in self.lemma_counts.items():
+            _, lemma_id, word_id = unpack_lemma_key(key)
+            lemmas.setdefault(self.lemma_table.values[lemma_id], {})[self.words[word_id]] = count
+        return lemmas
+
+    def get_lemma_pos(self):
+        """
+        Return the counts grouped by (lemma, universal part of speech), each
+        mapping the lowercase forms behind it to their counts.
+        """
+        lemma_pos = {}
+        for key, count in self.lemma_pos_counts.items():
+            upos_id, lemma_id, word_id = unpack_lemma_key(key)
+            group = (self.lemma_table.values[lemma_id], self.upos_table.values[upos_id])
+            lemma_pos.setdefault(group, {})[self.words[word_id]] = count
+        return lemma_pos
+
+    def get_example(self, features, policy=DEFAULT_SENTENCE_POLICY):
+        """
+        Pick the example sentence of a word. random is any sentence of its
+        sample, shortest the shortest sentence it was seen in and
+        representative the sentence of median length in its sample, which
+        passes over fragments and long quotes alike.
+        """
+        if policy == "shortest":
+            return self.sentences.get(features.shortest)
+        if policy == "representative":
+            sample = sorted(features.sentences, key=lambda sentence_id: (self.sentences.get_length(sentence_id),
+                                                                           sentence_id))
+            return self.sentences.get(sample[(len(sample) - 1) // 2])
+        return self.sentences.get(features.sentences[self.get_random().randint(1, len(features.sentences)) - 1])
+
+    def trim_sentences(self, force=False):
+        """
+        Drop the sentences no word refers to any more, such as those that
+        were sampled out of every word they contain. The store is only
+        rebuilt once it has doubled in size since it was last trimmed, so
+        calling this after every session costs little. force rebuilds it
+        anyway, for a store that is kept as it is.
+        """
+        if not force and len(self.sentences) < 2 * max(self.trimmed_size, 1):
+            return 0
+        before = len(self.sentences)
+        sentences = SentenceStore()
+        for features in self.entries:
+            features.sentences = [sentences.add(self.sentences.get(sentence_id))
+                                  for sentence_id in features.sentences]
+            features.shortest = sentences.add(self.sentences.get(features.shortest))
+        self.sentences = sentences
+        self.trimmed_size = len(sentences)
+        return before - len(sentences)
+
+    def merge_entry(self, features, other, other_features):
+        """
+        Merge the raw forms and sentence sample of a word from another
+        WordFeatures into features, translating the sentence ids.
+        """
+        raw = set(features.raw)
+        for word in other_features.raw:
+            if word not in raw:
+                raw.add(word)
+                features.raw.append(word)
+        self.offer_shortest(features, self.sentences.add(other.sentences.get(other_features.shortest)))
+        weight = other_features.sentence_count / len(other_features.sentences)
+        for sentence_id in other_features.sentences:
+            self.add_sentence_id(features, self.sentences.add(other.sentences.get(sentence_id)), weight)
+
+    def import_entry(self, other, other_features):
+        # copy a word that is new to this store with its sentence ids translated and its strings interned here
+        intern = self.strings.intern
+        return WordEntry(list(other_features.raw),
+                         [self.sentences.add(other.sentences.get(sentence_id))
+                          for sentence_id in other_features.sentences],
+                         other_features.sentence_count,
+                         self.sentences.add(other.sentences.get(other_features.shortest)),
+                         intern(other_features.pos), intern(other_features.upos),
+                         intern(other_features.xpos), intern(other_features.feats), intern(other_features.lemma),
+                         other_features.transliteration)
+
+
+def unpack_lemma_key(key):
+    # the upos id, lemma id and word id of a packed lemma count key
+    return (key >> (LEMMA_ID_BITS + WORD_ID_BITS), (key >> WORD_ID_BITS) & ((1 << LEMMA_ID_BITS) - 1),
+            key & ((1 << WORD_ID_BITS) - 1))
+
+
+def word_features_to_json(word_list, word_features):
+    """
+    Convert word_list and word_features to plain json data, with the words,
+    their counts and their entries in parallel lists. Only the sentences still
+    in a word's sample or kept as its shortest are written, so sentences that
+    were sampled out are dropped.
+    """
+    sentences = SentenceStore()
+    entries = []
+    for features in word_features.entries:
+        entry = features.to_list()
+        entry[1] = [sentences.add(word_features.sentences.get(sentence_id)) for sentence_id in features.sentences]
+        entry[3] = sentences.add(word_features.sentences.get(features.shortest))
+        entries.append(entry)
+    return {
+        "sentence_limit": word_features.sentence_limit,
+        "sentences": sentences.sentences,
+        "words": word_features.words,
+        "counts": [word_list[lcase] for lcase in word_features.words],
+        "entries": entries,
+        "lemmas": word_features.get_lemmas(),
+        "lemma_pos": [[lemma, upos, forms] for (lemma, upos), forms in word_features.get_lemma_pos().items()]
+    }
+
+
+def word_features_from_json(data):
+    """
+    Rebuild the WordFeatures written by word_features_to_json, with the counts
+    back in its word_list.
+    """
+    word_features = WordFeatures(data["sentence_limit"], data["sentences"])
+    intern = word_features.strings.intern
+    for lcase, count, entry in zip(data["words"], data["counts"], data["entries"]):
+        raw, sentence_ids, sentence_count, shortest, pos, upos, xpos, feats, lemma, transliteration = entry
+        word_features[lcase] = WordEntry(raw, sentence_ids, sentence_count, shortest, intern(pos), intern(upos),
+                                         intern(xpos), intern(feats), intern(lemma), transliteration)
+        word_features.counts[lcase] = count
+    for lemma, forms in data["lemmas"].items():
+        lemma_id = word_features.lemma_table.get_id(lemma)
+        for lcase, count in forms.items():
+            word_features.lemma_counts[lemma_id << WORD_ID_BITS | word_features.get_id(lcase)] = count
+    for lemma, upos, forms in data["lemma_pos"]:
+        group_id = word_features.upos_table.get_id(upos) << LEMMA_ID_BITS | word_features.lemma_table.get_id(lemma)
+        for lcase, count in forms.items():
+            word_features.lemma_pos_counts[group_id << WORD_ID_BITS | word_features.get_id(lcase)] = count
+    return word_features
@@ -0,0 +1,71 @@
+# Compare reading every cached session from the json files with streaming it from the sqlite session store.
+# Usage: python benchmarks/bench_cache_read.py <CACHE_DIRECTORY>
+# Run ConferenceScraperApp/migrate_cache.py on the directory first so both formats hold the same sessions.
+import os
+import sys
+import json
+import time
+import tracemalloc
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ConferenceScraperApp.session_store import SessionStore, get_session_store_path, JSON_CACHE_PATTERN
+
+
+def read_json(cache_directory, sessions):
+    talks = 0
+    paragraphs = 0
+    for lang, year, month in sessions:
+        with open(os.path.join(cache_directory, "%s_%s_%s.json" % (lang, year, month)), "r") as f:
+            session_json = json.load(f)
+        for talk in session_json["talks"]:
+            talks += 1
+            paragraphs += len(talk["paragraphs"])
+    return talks, paragraphs
+
+
+def read_store(store, sessions):
+    talks = 0
+    paragraphs = 0
+    for lang, year, month in sessions:
+        for talk in store.iter_talks(lang, year, month):
+            talks += 1
+            paragraphs += len(talk["paragraphs"])
+    return talks, paragraphs
+
+
+def report(name, elapsed, size, talks, paragraphs):
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print("%-7s %8.3fs %8.1f MB on disk %10.1f talks/s %12.1f paragraphs/s %8.1f MB/s %8.1f MB peak memory" %
+          (name, elapsed, size / 1e6, talks / elapsed, paragraphs / elapsed, size / 1e6 / elapsed, peak / 1e6))
+
+
+def main(argv):
+    cache_directory = argv[0]
+    sessions = []
+    json_size = 0
+    for filename in sorted(os.listdir(cache_directory)):
+        if m := JSON_CACHE_PATTERN.match(filename):
+            sessions.append(m.groups())
+            json_size += os.path.getsize(os.path.join(cache_directory, filename))
+    store = SessionStore(get_session_store_path(cache_directory))
+    sessions = [session for session in sessions if store.has_session(*session)]
+    if len(sessions) == 0:
+        print("No sessions found in both formats. Run migrate_cache.py first.")
+        return
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    talks, paragraphs = read_json(cache_directory, sessions)
+    report("json", time.perf_counter() - start, json_size, talks, paragraphs)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    talks, paragraphs = read_store(store, sessions)
+    report("sqlite", time.perf_counter() - start, os.path.getsize(get_session_store_path(cache_directory)),
+           talks, paragraphs)
+    store.close()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
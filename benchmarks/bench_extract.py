@@ -0,0 +1,65 @@
+# Compare extracting talks with the single pass parser against the beautiful soup extraction.
+# Usage: python benchmarks/bench_extract.py [<HTML_DIRECTORY>] [<REPEAT>]
+# HTML_DIRECTORY holds saved talk pages (*.html). Without it synthetic talk pages shaped like the real ones are used.
+import os
+import sys
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ConferenceScraperApp.extract import extract_talk, extract_talk_bs4
+
+
+def synthetic_page(index, paragraph_count=60):
+    paragraphs = "".join("<p data-aid=\"%d\" id=\"p%d\">Y en el día %d, hermanos y hermanas, "
+                         "<a class=\"scripture-ref\" href=\"/study/scriptures/bofm/1-ne/3?lang=spa\">1&#160;Nefi 3:7</a>"
+                         " nos enseña que &ldquo;el Señor&rdquo; prepara la vía<sup class=\"marker\">%d</sup>.</p>"
+                         % (i, i, index, i) for i in range(1, paragraph_count + 1))
+    navigation = "".join("<li><a class=\"item\" href=\"/nav/%d\"><span>Elemento %d</span></a></li>" % (i, i)
+                         for i in range(200))
+    return ("<!DOCTYPE html><html lang=\"es\"><head><meta charset=\"utf-8\"><title>Discurso %d</title>"
+            "<script>window.__INITIAL_STATE__ = {\"p\": \"<p id=p1>\"};</script>"
+            "<style>.body-block p { margin: 0 }</style></head><body><nav><ul>%s</ul></nav>"
+            "<header><h1 id=\"title1\">Discurso %d</h1><p class=\"author-name\">Por el élder Juan&nbsp;Pérez</p>"
+            "<p class=\"author-role\">De los Setenta</p><p class=\"kicker\" id=\"kicker1\">Un resumen.</p></header>"
+            "<div class=\"body-block\">%s</div><footer>%s</footer></body></html>"
+            % (index, navigation, index, paragraphs, navigation)).encode("utf-8")
+
+
+def load_pages(html_directory):
+    pages = []
+    for filename in sorted(os.listdir(html_directory)):
+        if filename.endswith(".html"):
+            with open(os.path.join(html_directory, filename), "rb") as f:
+                pages.append(f.read())
+    return pages
+
+
+def time_path(extract, pages, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        talks = [extract(page) for page in pages]
+    return (time.perf_counter() - start) / repeat, talks
+
+
+def main(argv):
+    pages = load_pages(argv[0]) if len(argv) > 0 else [synthetic_page(index) for index in range(50)]
+    repeat = int(argv[1]) if len(argv) > 1 else 3
+    if len(pages) == 0:
+        print("No talk pages found")
+        return
+    size = sum(len(page) for page in pages)
+
+    bs4_time, bs4_talks = time_path(extract_talk_bs4, pages, repeat)
+    fast_time, fast_talks = time_path(extract_talk, pages, repeat)
+    for name, elapsed in (("bs4", bs4_time), ("fast", fast_time)):
+        print("%-5s %8.3fs %10.1f talks/s %8.1f MB/s" % (name, elapsed, len(pages) / elapsed, size / 1e6 / elapsed))
+    print("speedup %.1fx" % (bs4_time / fast_time))
+
+    mismatches = [index for index, (fast, bs4) in enumerate(zip(fast_talks, bs4_talks)) if fast != bs4]
+    print("identical output: %s" % (len(mismatches) == 0))
+    for index in mismatches[:5]:
+        print("mismatch on page %d" % index)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
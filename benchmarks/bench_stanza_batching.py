@@ -0,0 +1,47 @@
+# Compare per-paragraph stanza processing with batched processing on a cached session.
+# Usage: python benchmarks/bench_stanza_batching.py <CACHE_FILE> [<BATCH_SIZE>]
+# CACHE_FILE is a session json written with --cache (e.g. cache/spa_2022_04.json)
+import os
+import sys
+import json
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import stanza
+from ConferenceScraperApp import app
+from ConferenceScraperApp.word_store import WordFeatures
+
+
+def time_path(nlp, paragraphs, iso_one, batch_size):
+    start = time.perf_counter()
+    word_features = WordFeatures()
+    word_list, word_features = app.process_paragraphs(True, nlp, None, paragraphs, word_features.counts, word_features,
+                                                      iso_one, False, False, batch_size, None)
+    return time.perf_counter() - start, word_list, word_features
+
+
+def main(argv):
+    cache_file = argv[0]
+    batch_size = int(argv[1]) if len(argv) > 1 else 32
+
+    with open(cache_file, "r") as f:
+        session_json = json.load(f)
+    iso_one = app.available_languages[session_json["language"]]["iso_one"]
+    paragraphs = [talk_para["paragraph"] for talk in session_json["talks"] for talk_para in talk["paragraphs"]]
+
+    nlp = stanza.Pipeline(lang=iso_one, processors='tokenize,pos,lemma')
+    # warm up the models so neither path pays the first call overhead
+    nlp(paragraphs[0])
+
+    single_time, single_list, single_features = time_path(nlp, paragraphs, iso_one, 1)
+    batch_time, batch_list, batch_features = time_path(nlp, paragraphs, iso_one, batch_size)
+
+    print("paragraphs:      %s" % len(paragraphs))
+    print("per paragraph:   %.2fs (%.1f paragraphs/s)" % (single_time, len(paragraphs) / single_time))
+    print("batch size %-4s  %.2fs (%.1f paragraphs/s)" % (batch_size, batch_time, len(paragraphs) / batch_time))
+    print("speedup:         %.2fx" % (single_time / batch_time))
+    print("identical counts: %s" % (list(single_list.items()) == list(batch_list.items())))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,48 @@
+# Measure the CLI startup cost with python -X importtime so import regressions are easy to spot.
+# Usage: python benchmarks/bench_startup.py [<RUNS>]
+import os
+import sys
+import time
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAIN = os.path.join(ROOT, "ConferenceScraperApp", "_main_.py")
+
+
+def time_help(runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, MAIN, "-h"], capture_output=True, check=True)
+        timings.append(time.perf_counter() - start)
+    return sorted(timings)
+
+
+def import_times():
+    # -X importtime writes "import time: self | cumulative | module" lines to stderr
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import ConferenceScraperApp.app"],
+                            capture_output=True, text=True, check=True, cwd=ROOT)
+    modules = []
+    for line in result.stderr.splitlines():
+        parts = line.split("|")
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            modules.append((int(parts[1]), parts[2].rstrip()))
+    return modules
+
+
+def main(argv):
+    runs = int(argv[0]) if len(argv) > 0 else 5
+    timings = time_help(runs)
+    print("ConferenceScraper -h over %s runs: min %.3fs median %.3fs max %.3fs" %
+          (runs, timings[0], timings[len(timings) // 2], timings[-1]))
+
+    modules = import_times()
+    app_total = [cumulative for cumulative, module in modules if module.strip() == "ConferenceScraperApp.app"]
+    print("import ConferenceScraperApp.app: %.3fs cumulative" % (app_total[0] / 1e6))
+    print("slowest imports (cumulative):")
+    for cumulative, module in sorted(modules, reverse=True)[:10]:
+        print("  %8.3fs %s" % (cumulative / 1e6, module))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
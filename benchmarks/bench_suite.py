@@ -0,0 +1,275 @@
+# The baseline for performance changes: runs the scraper end to end against the local fixture site, reruns it
+# from the cached sessions and writes the output of a large synthetic vocabulary, without network access.
+# Usage: python benchmarks/bench_suite.py [--pages <PAGE_CACHE>] [-l <LANGUAGE>] [-y <YEAR>] [-m <MONTH>]
+#        [--nlp <simple|real>] [--workers <NUM>] [--vocabulary <NUM>] [--repeat <NUM>] [--save <RESULTS>]
+#        [--baseline <RESULTS>]
+# PAGE_CACHE is the pages.sqlite3 of a --cache directory to replay real pages, otherwise synthetic pages are served.
+# --nlp simple (the default) splits the text on spaces and punctuation in place of stanza so only the scraper's own
+# work is measured; --nlp real loads the stanza or NLTK models of the language, which must already be downloaded.
+# --save writes the results to a json file and --baseline compares this run with one saved earlier.
+# EXAMPLE: python benchmarks/bench_suite.py --save before.json, make a change, then
+#          python benchmarks/bench_suite.py --baseline before.json
+import os
+import re
+import sys
+import json
+import time
+import getopt
+import random
+import resource
+import itertools
+import subprocess
+import tempfile
+from types import SimpleNamespace
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ConferenceScraperApp import app
+from ConferenceScraperApp.word_store import WordFeatures
+from benchmarks.fixture_site import FixtureSite, load_page_cache, start_server
+
+SCENARIOS = ("web", "cache", "output")
+# the metrics where a lower number is better, the others are throughputs
+LOWER_IS_BETTER = ("seconds", "talk_p50_ms", "talk_p90_ms", "talk_p99_ms", "fetch_p50_ms", "fetch_p99_ms",
+                   "peak_rss_mb", "growth_mb")
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+class SimpleNLP:
+    """
+    Stands in for a stanza pipeline with documents of the same shape, so the
+    benchmark measures the scraper rather than the models.
+    """
+
+    def __call__(self, paragraph):
+        sentences = []
+        for text in re.split(r"(?<=[.!?])\s+", paragraph.strip()):
+            if text:
+                words = [SimpleNamespace(text=token, pos="PUNCT" if not token[0].isalnum() else "NOUN",
+                                         upos="X", xpos="X", feats=None, lemma=token.lower())
+                         for token in TOKEN_PATTERN.findall(text)]
+                sentences.append(SimpleNamespace(text=text, words=words))
+        return SimpleNamespace(text=paragraph, sentences=sentences)
+
+    def bulk_process(self, paragraphs):
+        return [self(paragraph) for paragraph in paragraphs]
+
+
+def percentile(values, fraction):
+    if len(values) == 0:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def read_counted_tokens(path):
+    # the first column of the default output is the count of each word
+    with open(path, "r", encoding="utf-8") as f:
+        next(f)
+        return sum(int(line.split("\t", 1)[0]) for line in f if line.strip())
+
+
+def run_scraper(config, work_directory, cache):
+    """
+    Run the script against the fixture site and return the metrics taken from
+    its --profile report and output.
+    """
+    pages = load_page_cache(config["pages"]) if config["pages"] else None
+    server, url = start_server(FixtureSite(pages))
+    if config["nlp"] == "simple":
+        app.load_language_processing = lambda pos_support, iso_one, show_lemma: (SimpleNLP(), None)
+        app.download_stanza_model = lambda iso_one: None
+    output = os.path.join(work_directory, "output.tsv")
+    profile = os.path.join(work_directory, "profile.json")
+    argv = ["-l", config["lang"], "-y", config["year"], "-m", config["month"], "-o", output, "--profile", profile,
+            "--siteUrl", url, "--rateLimit", "0", "--workers", str(config["workers"])]
+    if cache:
+        argv += ["--cache", work_directory]
+    # the imports alone take a good amount of memory so report the growth over this point
+    base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    random.seed(0)
+    start = time.perf_counter()
+    app.run(argv)
+    elapsed = time.perf_counter() - start
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    server.shutdown()
+
+    with open(profile, "r", encoding="utf-8") as f:
+        report = json.load(f)
+    talk_seconds = [sum(stage["seconds"] for stage in talk["stages"].values()) for talk in report["talks"]]
+    fetch_seconds = [talk["stages"]["fetch"]["seconds"] for talk in report["talks"] if "fetch" in talk["stages"]]
+    tokens = read_counted_tokens(output)
+    metrics = {
+        "seconds": elapsed,
+        "talks": len(report["talks"]),
+        "tokens": tokens,
+        "talks_per_s": len(report["talks"]) / elapsed,
+        "tokens_per_s": tokens / elapsed,
+        "talk_p50_ms": percentile(talk_seconds, 0.5) * 1000,
+        "talk_p90_ms": percentile(talk_seconds, 0.9) * 1000,
+        "talk_p99_ms": percentile(talk_seconds, 0.99) * 1000,
+        "peak_rss_mb": peak_rss,
+        "growth_mb": peak_rss - base_rss
+    }
+    # the cached sessions aren't downloaded
+    if len(fetch_seconds) > 0:
+        metrics["fetch_p50_ms"] = percentile(fetch_seconds, 0.5) * 1000
+        metrics["fetch_p99_ms"] = percentile(fetch_seconds, 0.99) * 1000
+    return metrics
+
+
+def synthetic_vocabulary(size, seed=1):
+    # every word of the vocabulary is used at least once and the common ones many times
+    generator = random.Random(seed)
+    words = ["w%s" % i for i in range(size)]
+    cum_weights = list(itertools.accumulate(1.0 / (rank + 1) for rank in range(size)))
+    word_features = WordFeatures()
+    word_list = word_features.counts
+    for start in range(0, size, 16):
+        tokens = words[start:start + 16] + generator.choices(words, cum_weights=cum_weights, k=16)
+        annotation = [{"text": " ".join(tokens),
+                       "words": [[token, "NOUN", "NOUN", "", "", token] for token in tokens]}]
+        word_list, word_features = app.process_annotation(True, annotation, word_list, word_features, "", False)
+    return word_list, word_features
+
+
+def run_output(config, work_directory):
+    word_list, word_features = synthetic_vocabulary(config["vocabulary"])
+    output = os.path.join(work_directory, "output.tsv")
+    base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    random.seed(0)
+    start = time.perf_counter()
+    app.print_output(output, word_list, word_features, False, False, True, False, True, True, None, 0, "tsv",
+                     None, None)
+    elapsed = time.perf_counter() - start
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return {
+        "seconds": elapsed,
+        "words": len(word_list),
+        "words_per_s": len(word_list) / elapsed,
+        "bytes": os.path.getsize(output),
+        "peak_rss_mb": peak_rss,
+        "growth_mb": peak_rss - base_rss
+    }
+
+
+def run_scenario(scenario, config, work_directory):
+    if scenario == "prepare":
+        # fill the cache directory with the sessions for the cache scenario, only what the cache scenario reads is kept
+        run_scraper(config, work_directory, True)
+        for filename in os.listdir(work_directory):
+            if not filename.endswith(".json") or filename == "profile.json":
+                os.remove(os.path.join(work_directory, filename))
+        return {}
+    if scenario == "web":
+        return run_scraper(config, work_directory, False)
+    if scenario == "cache":
+        return run_scraper(config, work_directory, True)
+    return run_output(config, work_directory)
+
+
+def run_child(scenario, config, work_directory):
+    # each scenario runs in its own process so the peak memory of one doesn't hide the others
+    result = subprocess.run([sys.executable, __file__, "--run", scenario, json.dumps(config), work_directory],
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        print(result.stderr)
+        raise RuntimeError("the %s scenario failed" % scenario)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def run_suite(config, repeat):
+    results = {}
+    for scenario in SCENARIOS:
+        runs = []
+        for _ in range(repeat):
+            with tempfile.TemporaryDirectory() as work_directory:
+                if scenario == "cache":
+                    run_child("prepare", config, work_directory)
+                runs.append(run_child(scenario, config, work_directory))
+        # the run with the median time stands for the scenario
+        runs.sort(key=lambda run: run["seconds"])
+        results[scenario] = runs[len(runs) // 2]
+    return results
+
+
+def print_results(results, baseline):
+    for scenario, metrics in results.items():
+        print(scenario)
+        for name, value in metrics.items():
+            line = "  %-14s %14.2f" % (name, value)
+            if baseline is not None and baseline.get(scenario, {}).get(name):
+                before = baseline[scenario][name]
+                change = 100.0 * (value - before) / before
+                better = change < 0 if name in LOWER_IS_BETTER else change > 0
+                line += " %+8.1f%% %s" % (change, "" if abs(change) < 1 else "better" if better else "worse")
+            print(line.rstrip())
+
+
+def usage():
+    print("bench_suite [--pages <PAGE_CACHE>] [-l <LANGUAGE>] [-y <YEAR>] [-m <MONTH>] [--nlp <simple|real>] "
+          "[--workers <NUM>] [--vocabulary <NUM>] [--repeat <NUM>] [--save <RESULTS>] [--baseline <RESULTS>]")
+
+
+def main(argv):
+    config = {"pages": None, "lang": "eng", "year": "2019-2020", "month": "04,10", "nlp": "simple", "workers": 1,
+              "vocabulary": 200000}
+    repeat = 3
+    save = None
+    baseline = None
+    try:
+        opts, args = getopt.getopt(argv, "l:y:m:h", ["pages=", "language=", "year=", "month=", "nlp=", "workers=",
+                                                     "vocabulary=", "repeat=", "save=", "baseline="])
+    except getopt.GetoptError as err:
+        print(err)
+        usage()
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt == "-h":
+            usage()
+            sys.exit()
+        elif opt == "--pages":
+            config["pages"] = arg
+            if not os.path.isfile(arg):
+                assert False, "Page cache doesn't exist"
+        elif opt in ("-l", "--language"):
+            config["lang"] = arg
+        elif opt in ("-y", "--year"):
+            config["year"] = arg.replace(" ", "")
+        elif opt in ("-m", "--month"):
+            config["month"] = arg.replace(" ", "")
+        elif opt == "--nlp":
+            config["nlp"] = arg
+            if arg not in ("simple", "real"):
+                assert False, "nlp must be simple or real"
+        elif opt == "--workers":
+            config["workers"] = int(arg)
+        elif opt == "--vocabulary":
+            config["vocabulary"] = int(arg)
+        elif opt == "--repeat":
+            repeat = int(arg)
+            if repeat < 1:
+                assert False, "repeat must be at least 1"
+        elif opt == "--save":
+            save = arg
+        elif opt == "--baseline":
+            with open(arg, "r", encoding="utf-8") as f:
+                baseline = json.load(f)["results"]
+        else:
+            assert False, "unhandled option"
+    if config["nlp"] == "simple" and not app.available_languages[config["lang"]]["pos"]:
+        assert False, "--nlp simple stands in for stanza, pick a language processed with stanza or use --nlp real"
+    if config["nlp"] == "simple" and config["workers"] > 1:
+        assert False, "--nlp simple only replaces the models in this process, use --nlp real with --workers"
+
+    results = run_suite(config, repeat)
+    print_results(results, baseline)
+    if save is not None:
+        with open(save, "w", encoding="utf-8") as f:
+            json.dump({"config": config, "results": results}, f, indent=1)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == "--run":
+        print(json.dumps(run_scenario(sys.argv[2], json.loads(sys.argv[3]), sys.argv[4])))
+    else:
+        main(sys.argv[1:])
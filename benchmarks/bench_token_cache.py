@@ -0,0 +1,87 @@
+# Compare the NLTK path with and without the lemma and transliteration caches on a cached multi-year session set.
+# Usage: python benchmarks/bench_token_cache.py <CACHE_DIRECTORY> <LANGUAGE> [<TOKEN_CACHE_SIZE>]
+# CACHE_DIRECTORY holds the sessions of LANGUAGE (e.g. tgl or smo) written with --cache, as json files or
+# sessions.sqlite3. The lemma and transliteration lookups are included wherever the language supports them.
+import os
+import sys
+import json
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ConferenceScraperApp import app
+from ConferenceScraperApp.session_store import SessionStore, get_session_store_path, JSON_CACHE_PATTERN
+from ConferenceScraperApp.tokens import TOKEN_CACHE_SIZE
+from ConferenceScraperApp.word_store import WordFeatures
+
+
+def load_sessions(cache_directory, lang):
+    sessions = []
+    for filename in sorted(os.listdir(cache_directory)):
+        if (m := JSON_CACHE_PATTERN.match(filename)) and m.group(1) == lang:
+            with open(os.path.join(cache_directory, filename), "r") as f:
+                talks = json.load(f)["talks"]
+            sessions.append([talk_para["paragraph"] for talk in talks for talk_para in talk["paragraphs"]])
+    store_path = get_session_store_path(cache_directory)
+    if len(sessions) == 0 and os.path.exists(store_path):
+        store = SessionStore(store_path)
+        for (year, month) in store.connection.execute("SELECT year, month FROM sessions WHERE lang = ? "
+                                                      "ORDER BY year, month", (lang,)).fetchall():
+            sessions.append([talk_para["paragraph"] for talk in store.iter_talks(lang, year, month)
+                             for talk_para in talk["paragraphs"]])
+        store.close()
+    return sessions
+
+
+def time_sessions(sessions, language_data, iso_one, show_transliteration, token_cache_size):
+    app.init_token_caches(iso_one, token_cache_size, None, None)
+    tokens = 0
+    counts = []
+    start = time.perf_counter()
+    for paragraphs in sessions:
+        # each session is counted on its own as in --incremental so only the caches carry over between them
+        word_features = WordFeatures()
+        word_list = word_features.counts
+        for paragraph in paragraphs:
+            annotation = app.annotate_paragraph_nltk(language_data, paragraph, language_data is not None, iso_one)
+            tokens += sum(len(sentence["words"]) for sentence in annotation)
+            word_list, word_features = app.process_annotation(False, annotation, word_list, word_features, iso_one,
+                                                              show_transliteration)
+        counts.append(word_list)
+    return time.perf_counter() - start, tokens, counts
+
+
+def main(argv):
+    cache_directory = argv[0]
+    lang = argv[1]
+    token_cache_size = int(argv[2]) if len(argv) > 2 else TOKEN_CACHE_SIZE
+    if app.available_languages[lang]["pos"]:
+        print("%s is processed with stanza, pick a language processed with NLTK" % lang)
+        return
+    iso_one = app.available_languages[lang]["iso_one"]
+    sessions = load_sessions(cache_directory, lang)
+    if len(sessions) == 0:
+        print("No cached sessions found for %s" % lang)
+        return
+
+    from transliterate import get_available_language_codes
+    show_transliteration = iso_one in get_available_language_codes()
+    nlp, language_data = app.load_language_processing(False, iso_one, True)
+    # load nltk and its tokenizer data before anything is timed
+    app.annotate_paragraph_nltk(language_data, sessions[0][0], False, iso_one)
+
+    uncached_time, tokens, uncached_counts = time_sessions(sessions, language_data, iso_one, show_transliteration, 0)
+    cached_time, tokens, cached_counts = time_sessions(sessions, language_data, iso_one, show_transliteration,
+                                                       token_cache_size)
+    print("%s sessions, %s tokens" % (len(sessions), tokens))
+    for name, elapsed in (("uncached", uncached_time), ("cached", cached_time)):
+        print("%-9s %8.3fs %12.1f tokens/s" % (name, elapsed, tokens / elapsed))
+    for name, cache in app.get_token_caches(iso_one).items():
+        lookups = cache.hits + cache.misses
+        if lookups > 0:
+            print("%-16s %10d lookups %6.1f%% cached %8d entries" %
+                  (name, lookups, 100.0 * cache.hits / lookups, len(cache.entries)))
+    print("identical counts: %s" % (uncached_counts == cached_counts))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
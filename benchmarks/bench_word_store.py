@@ -0,0 +1,131 @@
+# Compare the time and peak memory of storing word features in plain lists (the original layout)
+# with the compact WordFeatures store.
+# Usage: python benchmarks/bench_word_store.py [<ANNOTATIONS_FILE>] [<SENTENCE_LIMIT>] [<VOCABULARY>]
+# ANNOTATIONS_FILE is the annotations.sqlite3 from a --cache directory after a multi-year run. Without it a
+# synthetic corpus with a Zipf-like word distribution over VOCABULARY words (50000 by default) and repeated
+# boilerplate sentences is used.
+import os
+import sys
+import json
+import time
+import random
+import itertools
+import resource
+import sqlite3
+import subprocess
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ConferenceScraperApp import app
+from ConferenceScraperApp.word_store import WordFeatures, DEFAULT_SENTENCE_LIMIT
+
+SESSION_PARAGRAPHS = 1000
+
+
+def synthetic_annotations(paragraphs=20000, vocabulary=50000, seed=1):
+    # the features of every word are their own strings, as they are when read from the annotation cache
+    features = [["NOUN", "NOUN", "NN", "Number=Sing"], ["VERB", "VERB", "VBD", "Mood=Ind|Tense=Past"],
+                ["ADJ", "ADJ", "JJ", "Degree=Pos"]]
+    generator = random.Random(seed)
+    words = ["w%s" % i for i in range(vocabulary)]
+    cum_weights = list(itertools.accumulate(1.0 / (rank + 1) for rank in range(vocabulary)))
+    boilerplate = ["In the name of Jesus Christ, amen.", "Behold, I stand at the door, and knock."]
+    for _ in range(paragraphs):
+        annotation = []
+        for _ in range(4):
+            if generator.random() < 0.1:
+                text = generator.choice(boilerplate)
+                tokens = text.split()
+            else:
+                tokens = generator.choices(words, cum_weights=cum_weights, k=18)
+                text = " ".join(tokens)
+            annotation.append({"text": text, "words": [[token] + features[len(token) % 3] + [token]
+                                                       for token in tokens]})
+        yield json.loads(json.dumps(annotation))
+
+
+def cached_annotations(path):
+    connection = sqlite3.connect(path)
+    for (annotation,) in connection.execute("SELECT annotation FROM annotations"):
+        yield json.loads(annotation)
+    connection.close()
+
+
+class LegacyFeatures(dict):
+    # the original layout had no lemma indexes
+    def count_lemma(self, lcase, lemma, upos, count=1):
+        pass
+
+
+def legacy_create_lists(lcase, word_list, word_features, word, sentence, pos, upos, xpos, feats, lemma,
+                        transliteration):
+    word_list[lcase] = 1
+    word_features[lcase] = {
+        'raw': [word],
+        'sentences': [sentence],
+        'pos': pos,
+        'upos': upos,
+        'xpos': xpos,
+        'feats': feats,
+        'lemma': lemma,
+        'transliteration': transliteration
+    }
+    return word_list, word_features
+
+
+def legacy_update_lists(lcase, word_list, word_features, word, sentence):
+    word_list[lcase] += 1
+    if word not in word_features[lcase]['raw']:
+        word_features[lcase]['raw'].append(word)
+    if sentence not in word_features[lcase]['sentences']:
+        word_features[lcase]['sentences'].append(sentence)
+    return word_list, word_features
+
+
+def run_store(store, annotations_path, sentence_limit, vocabulary):
+    if store == "legacy":
+        app.create_lists = legacy_create_lists
+        app.update_lists = legacy_update_lists
+        word_features = LegacyFeatures()
+        word_list = {}
+    else:
+        word_features = WordFeatures(sentence_limit)
+        word_list = word_features.counts
+    annotations = cached_annotations(annotations_path) if annotations_path \
+        else synthetic_annotations(vocabulary=vocabulary)
+
+    # the imports alone take a good amount of memory so report the growth over this point
+    base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    start = time.perf_counter()
+    tokens = 0
+    for i, annotation in enumerate(annotations):
+        tokens += sum(len(sentence["words"]) for sentence in annotation)
+        word_list, word_features = app.process_annotation(True, annotation, word_list, word_features, "", False)
+        # the script trims the sentence store at the end of every session, about this many paragraphs
+        if store != "legacy" and i % SESSION_PARAGRAPHS == SESSION_PARAGRAPHS - 1:
+            word_features.trim_sentences()
+    elapsed = time.perf_counter() - start
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({"store": store, "seconds": elapsed, "tokens": tokens, "words": len(word_list),
+                      "peak_rss_mb": peak_rss, "growth_mb": peak_rss - base_rss}))
+
+
+def main(argv):
+    annotations_path = argv[0] if len(argv) > 0 else ""
+    sentence_limit = argv[1] if len(argv) > 1 else str(DEFAULT_SENTENCE_LIMIT)
+    vocabulary = argv[2] if len(argv) > 2 else "50000"
+    # each store runs in its own process so the peak memory of one doesn't hide the other
+    for store in ("legacy", "compact"):
+        result = subprocess.run([sys.executable, __file__, "--run", store, annotations_path, sentence_limit,
+                                 vocabulary],
+                                capture_output=True, text=True, check=True)
+        report = json.loads(result.stdout.strip().splitlines()[-1])
+        print("%-9s %8.2fs %12.0f tokens/s %9s words %9.1f MB peak RSS (+%.1f MB while processing)" %
+              (report["store"], report["seconds"], report["tokens"] / report["seconds"], report["words"],
+               report["peak_rss_mb"], report["growth_mb"]))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == "--run":
+        run_store(sys.argv[2], sys.argv[3], int(sys.argv[4]), int(sys.argv[5]))
+    else:
+        main(sys.argv[1:])
@@ -0,0 +1,147 @@
+# A local stand-in for the conference site that serves saved or synthetic session index and talk pages,
+# so the scraper can be run end to end without network access.
+# Usage: python benchmarks/fixture_site.py [<PAGE_CACHE>] [<PORT>]
+# PAGE_CACHE is the pages.sqlite3 of a --cache directory and its pages are served as they were saved. Without it
+# synthetic sessions shaped like the real ones are served for every year and month. Run the script with
+# --siteUrl http://127.0.0.1:<PORT> to scrape from it.
+import sys
+import random
+import sqlite3
+import threading
+import zlib
+from urllib.parse import urlsplit
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# the vocabulary of the synthetic talks, frequent words first
+SYNTHETIC_WORDS = ("the and of to in a that we our is his he for with as be it will are Lord God Christ Jesus "
+                   "faith love prayer family temple covenant Savior repentance Father Heavenly children gospel "
+                   "spirit testimony scriptures service heart hope peace joy light truth grace mercy blessings "
+                   "ordinances priesthood prophet apostles disciples commandments obedience forgiveness baptism "
+                   "sacrament resurrection atonement eternal salvation redemption sanctification consecration "
+                   "ministering compassion kindness humility patience charity diligence endurance revelation").split()
+SYNTHETIC_TALKS = 30
+SYNTHETIC_PARAGRAPHS = 25
+
+
+def synthetic_index_page(year, month, lang, talks=SYNTHETIC_TALKS):
+    links = "".join("<li><a class=\"listTile listTile--talk\" href=\"/study/general-conference/%s/%s/talk%d\">"
+                    "<p class=\"title\">Talk %d</p></a></li>" % (year, month, i, i) for i in range(talks))
+    navigation = "".join("<li><a class=\"item\" href=\"/nav/%d?lang=%s\">Item %d</a></li>" % (i, lang, i)
+                         for i in range(100))
+    return ("<!DOCTYPE html><html><head><meta charset=\"utf-8\"><title>General Conference %s %s</title></head>"
+            "<body><nav><ul>%s</ul></nav><ul class=\"talks\">%s</ul></body></html>" %
+            (month, year, navigation, links)).encode("utf-8")
+
+
+def synthetic_talk_page(year, month, talk, paragraphs=SYNTHETIC_PARAGRAPHS):
+    # every page is generated from its own seed so the same talk always has the same text
+    generator = random.Random("%s-%s-%s" % (year, month, talk))
+    cum_weights = []
+    total = 0.0
+    for rank in range(len(SYNTHETIC_WORDS)):
+        total += 1.0 / (rank + 1)
+        cum_weights.append(total)
+    body = []
+    for i in range(1, paragraphs + 1):
+        sentences = []
+        for _ in range(generator.randint(2, 5)):
+            words = generator.choices(SYNTHETIC_WORDS, cum_weights=cum_weights, k=generator.randint(6, 20))
+            sentences.append("%s%s." % (words[0][0].upper(), " ".join(words)[1:]))
+        body.append("<p data-aid=\"%d\" id=\"p%d\">%s<sup class=\"marker\">%d</sup></p>" %
+                    (i, i, " ".join(sentences), i))
+    speaker = generator.randint(1, 40)
+    return ("<!DOCTYPE html><html><head><meta charset=\"utf-8\"><title>Talk %s</title>"
+            "<script>window.__INITIAL_STATE__ = {};</script></head><body>"
+            "<header><h1 id=\"title1\">Talk %s of %s %s</h1><p class=\"author-name\">By Elder Speaker&nbsp;%d</p>"
+            "<p class=\"author-role\">Of the Seventy</p><p class=\"kicker\" id=\"kicker1\">A summary of talk %s.</p>"
+            "</header><div class=\"body-block\">%s</div><footer><p id=\"note1\">Notes</p></footer></body></html>" %
+            (talk, talk, month, year, speaker, talk, "".join(body))).encode("utf-8")
+
+
+class FixtureSite:
+    """
+    The pages served by the fixture server. Saved pages are looked up by their
+    path and query. Without saved pages, or for a page that wasn't saved,
+    synthetic pages are generated for any session.
+    """
+
+    def __init__(self, pages=None, talks=SYNTHETIC_TALKS, paragraphs=SYNTHETIC_PARAGRAPHS):
+        self.pages = pages if pages is not None else {}
+        self.talks = talks
+        self.paragraphs = paragraphs
+
+    def get(self, path):
+        page = self.pages.get(path)
+        if page is not None:
+            return page
+        route, _, query = path.partition("?")
+        parts = route.strip("/").split("/")
+        if len(parts) < 4 or parts[:2] != ["study", "general-conference"]:
+            return None
+        lang = query.rpartition("lang=")[2]
+        if len(parts) == 4:
+            return synthetic_index_page(parts[2], parts[3], lang, self.talks)
+        if len(parts) == 5 and parts[4].startswith("talk"):
+            return synthetic_talk_page(parts[2], parts[3], parts[4][4:], self.paragraphs)
+        return None
+
+
+def load_page_cache(path):
+    # the pages are saved under their full url and served by path and query so any host can replay them
+    connection = sqlite3.connect(path)
+    pages = {}
+    for url, content in connection.execute("SELECT url, content FROM pages"):
+        parts = urlsplit(url)
+        pages["%s?%s" % (parts.path, parts.query) if parts.query else parts.path] = zlib.decompress(content)
+    connection.close()
+    return pages
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        content = self.server.site.get(self.path)
+        if content is None:
+            self.send_error(404)
+            return
+        self.server.requests += 1
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+class FixtureServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # every fetch worker connects at once, the default backlog of 5 makes the rest wait for a retransmit
+    request_queue_size = 64
+
+
+def start_server(site, port=0):
+    """
+    Serve site from a background thread and return the server along with the
+    url to pass to --siteUrl.
+    """
+    server = FixtureServer(("127.0.0.1", port), FixtureHandler)
+    server.site = site
+    server.requests = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, "http://127.0.0.1:%s" % server.server_address[1]
+
+
+def main(argv):
+    pages = load_page_cache(argv[0]) if len(argv) > 0 and argv[0] else None
+    port = int(argv[1]) if len(argv) > 1 else 8000
+    server, url = start_server(FixtureSite(pages), port)
+    print("Serving %s at %s" % ("%s saved pages" % len(pages) if pages else "synthetic pages", url))
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])